@@ -5,13 +5,44 @@ from PyQt5.QtWidgets import QApplication
 
 from src import MainWindow
 
+# MainWindow argument of each config.toml option, missing sections and
+# options (e.g. in config written by older version) keep MainWindow defaults
+OPTIONS = {
+    ("cache", "budget_mb"): "cache_budget_mb",
+    ("cache", "prefetch"): "prefetch",
+    ("cache", "workers"): "loader_workers",
+    ("labels", "png_compression"): "png_compression",
+    ("labels", "mode"): "label_mode",
+    ("tiles", "min_megapixels"): "tile_min_megapixels",
+    ("tiles", "tile_size"): "tile_size",
+    ("tiles", "cache_tiles"): "tile_cache",
+    ("history", "budget_mb"): "history_mb",
+    ("brush", "pen_pressure"): "pen_pressure",
+    ("paths", "sam_decoder"): "prompt_decoder",
+    ("prompts", "threads"): "prompt_threads",
+    ("profiling", "enabled"): "profile",
+    ("profiling", "trace"): "trace_path",
+    ("wand", "tolerance"): "wand_tolerance",
+    ("claims", "batch"): "claim_batch",
+    ("claims", "owner"): "claim_owner",
+    ("claims", "ttl_s"): "claim_ttl_s",
+    ("preview", "max_side"): "preview_size",
+    ("filmstrip", "thumbnail_size"): "thumbnail_size",
+    ("filmstrip", "workers"): "thumbnail_workers",
+}
+
 
 if __name__ == "__main__":
     with open("config.toml", "rb") as f:
         config = tomllib.load(f)
     path_to_dataset = config["paths"]["data"]
     app = QApplication(sys.argv)
-    mw = MainWindow(path_to_dataset)
+    kwargs = {}
+    for (section, key), arg in OPTIONS.items():
+        options = config.get(section, {})
+        if key in options:
+            kwargs[arg] = options[key]
+    mw = MainWindow(path_to_dataset, **kwargs)
     mw.show()
     mw.load_latest_sample()
     sys.exit(app.exec_())
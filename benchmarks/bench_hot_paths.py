@@ -0,0 +1,182 @@
+"""
+Offscreen benchmarks of interactive hot paths on synthetic samples.
+Run from repo root, e.g.:
+python benchmarks/bench_hot_paths.py --sizes 1,10,50 --out bench.json
+python benchmarks/bench_hot_paths.py --baseline bench.json
+"""
+
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from PyQt5.QtCore import Qt, QEvent, QPointF, QT_VERSION_STR, PYQT_VERSION_STR
+from PyQt5.QtGui import QColor, QImage, QMouseEvent, QPainter
+from PyQt5.QtWidgets import QApplication
+import numpy as np
+
+from src.graphics_view import GraphicsView
+from src.sample_loader import Sample
+from src.segment_index import SegmentIndex
+
+CLASS_COLORS = {1: "#FF0000", 2: "#00FF00"}
+MOVES_PER_FRAME = 16  # 1 kHz mouse at 60 Hz frame rate
+
+
+def make_sample(megapixels: float, segment_side: int = 64) -> Sample:
+    # 4:3 gradient image and square grid of SAM segments
+    w = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    h = int(megapixels * 1e6 / w)
+    x = np.arange(w, dtype=np.uint32)[None, :]
+    y = np.arange(h, dtype=np.uint32)[:, None]
+    argb = 0xFF000000 | (x % 256) << 16 | (y % 256) << 8 | (x + y) % 256
+    argb = np.ascontiguousarray(argb, dtype=np.uint32)
+    image = QImage(argb.data, w, h, w * 4, QImage.Format.Format_ARGB32).copy()
+    cols = (w + segment_side - 1) // segment_side
+    ids = (y // segment_side * cols + x // segment_side + 1).astype(np.uint32)
+    ids = ids.astype(np.uint16 if ids.max() < 2**16 else np.uint32)
+    index = SegmentIndex(ids)
+    return Sample("bench", image, sam_index=index)
+
+
+def timed(fn, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t) * 1000)
+    times.sort()
+    return {
+        "median_ms": statistics.median(times),
+        "p95_ms": times[min(len(times) - 1, int(len(times) * 0.95))],
+        "min_ms": times[0],
+        "repeat": repeat,
+    }
+
+
+def send_mouse(view: GraphicsView, kind: QEvent.Type, scene_pos: QPointF):
+    # goes through QGraphicsView dispatch, like real mouse input
+    pos = QPointF(view.mapFromScene(scene_pos))
+    button = Qt.MouseButton.LeftButton
+    buttons = Qt.MouseButton.NoButton if kind == QEvent.MouseButtonRelease else button
+    event = QMouseEvent(kind, pos, button, buttons, Qt.KeyboardModifier.NoModifier)
+    QApplication.sendEvent(view.viewport(), event)
+
+
+def bench_size(megapixels: float, label_mode: str, repeat: int, tmp: Path) -> dict:
+    sample = make_sample(megapixels)
+    class_colors = CLASS_COLORS if label_mode == "class_id" else None
+    view = GraphicsView(None, class_colors=class_colors)
+    view.resize(1280, 960)
+    view.show()
+    scene = view.scene()
+    label, sam = scene.label_item, scene.sam_item
+    results = {"width": sample.image.width(), "height": sample.image.height()}
+
+    results["load_sample"] = timed(lambda: view.load_sample(sample), repeat)
+    view.set_brush_color(QColor(CLASS_COLORS[1]))
+
+    w, h = results["width"], results["height"]
+    center = QPointF(w / 2, h / 2)
+    view.handle_sam_signal(True)
+    results["sam_click"] = timed(lambda: sam.handle_click(center), repeat)
+    bundle = sample.sam_index.pixels(sample.sam_index.segment_at(w // 2, h // 2))
+    results["draw_bundle"] = timed(lambda: label._draw_bundle(bundle), repeat)
+    sam.handle_wand_mode(True)
+    results["wand_click"] = timed(lambda: sam.handle_click(center), repeat)
+    sam.handle_wand_mode(False)
+    view.handle_sam_signal(False)
+
+    # zig-zag stroke of 1000 mouse moves at 1:1 zoom around image center
+    view.resetTransform()
+    view.centerOn(center)
+    moves = [QPointF(w / 2 - 500 + i, h / 2 + (i % 20) * 2) for i in range(1000)]
+
+    def stroke():
+        send_mouse(view, QEvent.MouseButtonPress, moves[0])
+        for i, pos in enumerate(moves, 1):
+            send_mouse(view, QEvent.MouseMove, pos)
+            # no event loop runs here, so coalesced moves are flushed as the
+            # frame timer would, then queued repaints are processed
+            if i % MOVES_PER_FRAME == 0:
+                label._flush_stroke()
+                QApplication.processEvents()
+        send_mouse(view, QEvent.MouseButtonRelease, moves[-1])
+
+    results["stroke_1000_moves"] = timed(stroke, repeat)
+    median_s = results["stroke_1000_moves"]["median_ms"] / 1000
+    results["stroke_moves_per_s"] = len(moves) / median_s if median_s > 0 else None
+
+    target = QImage(view.size(), QImage.Format.Format_ARGB32_Premultiplied)
+
+    def render():
+        painter = QPainter(target)
+        view.render(painter)
+        painter.end()
+
+    results["render_view"] = timed(render, repeat)
+    out_path = tmp / "label.png"
+    results["save_label"] = timed(lambda: view.save_label_to(out_path), repeat)
+    view.deleteLater()
+    return results
+
+
+def compare(current: dict, baseline: dict):
+    print(f"{'case':<22}{'metric':<20}{'base ms':>10}{'now ms':>10}{'ratio':>8}")
+    for case, metrics in current["results"].items():
+        for metric, value in metrics.items():
+            base = baseline["results"].get(case, {}).get(metric)
+            if not isinstance(value, dict) or not isinstance(base, dict):
+                continue
+            ratio = value["median_ms"] / base["median_ms"] if base["median_ms"] else 0
+            print(
+                f"{case:<22}{metric:<20}{base['median_ms']:>10.2f}"
+                f"{value['median_ms']:>10.2f}{ratio:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", default="1,10,50", help="megapixels, comma separated"
+    )
+    parser.add_argument("--label-modes", default="rgba,class_id")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", default="bench.json")
+    parser.add_argument("--baseline", help="previous results to compare with")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "qt": QT_VERSION_STR,
+            "pyqt": PYQT_VERSION_STR,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.label_modes.split(","):
+            for size in args.sizes.split(","):
+                case = f"{mode}/{size}MP"
+                print(f"Running {case}")
+                report["results"][case] = bench_size(
+                    float(size), mode, args.repeat, Path(tmp)
+                )
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {args.out}")
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            compare(report, json.load(f))
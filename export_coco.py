@@ -0,0 +1,31 @@
+"""
+Exports labels to single COCO instances JSON: label colors are mapped to class ids
+from classes.json and every 4-connected region of one class becomes an annotation,
+encoded as compressed RLE or simplified polygon. e.g. python export_coco.py --mode polygon
+"""
+
+import argparse
+import os
+import time
+import tomllib
+from pathlib import Path
+
+from src.coco_export import export_coco
+
+if __name__ == "__main__":
+    with open("config.toml", "rb") as f:
+        config = tomllib.load(f)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data", default=config["paths"]["data"])
+    parser.add_argument("--out", default="coco.json")
+    parser.add_argument("--mode", choices=("rle", "polygon"), default="rle")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="polygon px")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    t = time.perf_counter()
+    images, annotations = export_coco(
+        Path(args.data), Path(args.out), args.workers, args.mode, args.tolerance
+    )
+    print(f"Exported {annotations} annotations of {images} labels to {args.out}")
+    print(f"Took {time.perf_counter() - t:.1f}s")
@@ -0,0 +1,36 @@
+"""
+Packs images, sam and embeddings folders of dataset into few large
+memory-mapped chunk files (<data>/pack), which are used by the annotator
+in place of folders. Fewer, larger files are much faster on network storage.
+e.g. python pack.py pack --data dataset, python pack.py unpack --out restored
+"""
+
+import argparse
+import time
+import tomllib
+from pathlib import Path
+
+from src.packed_dataset import PackedDataset
+
+if __name__ == "__main__":
+    with open("config.toml", "rb") as f:
+        config = tomllib.load(f)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("command", choices=("pack", "unpack"))
+    parser.add_argument("--data", default=config["paths"]["data"])
+    parser.add_argument("--out", default=None, help="unpack target, default <data>")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--chunk-gb", type=float, default=4.0)
+    args = parser.parse_args()
+
+    workdir = Path(args.data)
+    pack_dir = workdir / "pack"
+    t = time.perf_counter()
+    if args.command == "pack":
+        chunk_bytes = int(args.chunk_gb * (1 << 30))
+        PackedDataset.pack(workdir, pack_dir, args.workers, chunk_bytes)
+        print(f"Packed {workdir} into {pack_dir}/ in {time.perf_counter() - t:.1f}s")
+    else:
+        out_dir = Path(args.out) if args.out else workdir
+        PackedDataset(pack_dir).unpack(out_dir, args.workers)
+        print(f"Unpacked {pack_dir} into {out_dir}/ in {time.perf_counter() - t:.1f}s")
@@ -0,0 +1,33 @@
+"""
+Converts 8-bit grayscale .PNG SAM masks of dataset
+into .npz masks with embedded segment index.
+Source .png files are removed only with --remove flag.
+"""
+
+from pathlib import Path
+import sys
+from PIL import Image
+import tomllib
+
+import numpy as np
+from tqdm import tqdm
+
+from sam_format import save_npz
+
+if __name__ == "__main__":
+    with open("config.toml", "rb") as f:
+        config = tomllib.load(f)
+    sam_path = Path(config["paths"]["data"]) / "sam"
+    assert sam_path.exists(), "Data path must contain 'sam' folder to convert"
+    remove = "--remove" in sys.argv[1:]
+
+    converted = 0
+    for png_path in tqdm(sorted(sam_path.glob("*.png"))):
+        npz_path = png_path.with_suffix(".npz")
+        if not npz_path.exists():
+            ids = np.array(Image.open(png_path).convert("L"))  # uint8
+            save_npz(npz_path, ids)
+            converted += 1
+        if remove:
+            png_path.unlink()
+    print(f"Converted {converted} masks")
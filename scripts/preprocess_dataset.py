@@ -1,20 +1,65 @@
 """
 Predicts segmentation masks via SAM model
 for all images in given dataset.
-Saves mask as 8-bit grayscale .PNG
+Saves mask as .npz with 16-bit (or wider) ids and
+segment index, see sam_format.py
+Optionally saves image encoder embedding for point prompts in GUI
+
+Decoding and mask encoding run on worker threads overlapped with inference.
+Images whose mask is newer than the image are skipped, and masks are
+written atomically, so an interrupted run resumes where it stopped.
+
+Work can be split across nodes sharing the dataset and across model
+replicas of one node, then checked once all shards are done, e.g.:
+python scripts/preprocess_dataset.py --shard 0/4 --workers 3
+python scripts/preprocess_dataset.py --verify
 """
 
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
 import time
+import zlib
 from PIL import Image
 import tomllib
 
 import numpy as np
+import torch
 from tqdm import tqdm
 from segment_anything import sam_model_registry, SamAutomaticMaskGenerator
 
+from sam_format import ids_dtype, save_embedding, save_npz
+
+
+class MaskGenerator(SamAutomaticMaskGenerator):
+    def generate_with_embedding(
+        self, image: np.ndarray
+    ) -> tuple[list[dict], np.ndarray]:
+        # generator encodes full image crop first and resets predictor after its
+        # masks, embedding is kept right before reset, so encoder runs only once
+        embedding = None
+        reset_image = self.predictor.reset_image
 
-def make_annotator(weights_path: str, device: str) -> SamAutomaticMaskGenerator:
+        def keep_embedding():
+            nonlocal embedding
+            if embedding is None and self.predictor.original_size == image.shape[:2]:
+                embedding = self.predictor.get_image_embedding().cpu().numpy()
+            reset_image()
+
+        self.predictor.reset_image = keep_embedding
+        try:
+            masks = self.generate(image)
+        finally:
+            del self.predictor.reset_image
+        return masks, embedding
+
+
+def make_annotator(weights_path: str, device: str) -> MaskGenerator:
     model_type = "vit_h"
     print(f"Loading {model_type} on {device} device")
     t1 = time.perf_counter()
@@ -22,12 +67,204 @@ def make_annotator(weights_path: str, device: str) -> SamAutomaticMaskGenerator:
     t2 = time.perf_counter()
     sam.to(device)
     t3 = time.perf_counter()
-    mask_generator = SamAutomaticMaskGenerator(sam)
+    mask_generator = MaskGenerator(sam)
     print(f"Load weights: {(t2-t1):.3f}s\nMove to {device}: {(t3-t2):.3f}s")
     return mask_generator
 
 
+class StageTimer:
+    # busy seconds per pipeline stage, stages may run on different threads
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def report(self, wall: float):
+        print(f"Wall time: {wall:.1f}s")
+        for stage, seconds in self.seconds.items():
+            n = self.counts[stage]
+            rate = n / seconds if seconds > 0 else float("inf")
+            print(f"{stage:>7}: {n} images, {seconds:.1f}s busy, {rate:.2f} img/s")
+
+
+def is_up_to_date(img_path: Path, out_path: Path) -> bool:
+    return (
+        out_path.exists() and out_path.stat().st_mtime_ns >= img_path.stat().st_mtime_ns
+    )
+
+
+def decode(img_path: Path, timer: StageTimer) -> np.ndarray:
+    t = time.perf_counter()
+    img = np.array(Image.open(img_path).convert("RGB"))
+    timer.add("decode", time.perf_counter() - t)
+    return img
+
+
+def encode(masks: list[dict], shape: tuple, out_path: Path, timer: StageTimer):
+    t = time.perf_counter()
+    sorted_masks = sorted(masks, key=(lambda x: x["area"]), reverse=True)
+    label = np.zeros(shape, dtype=ids_dtype(len(sorted_masks)))
+    for i, sm in enumerate(sorted_masks):
+        m = sm["segmentation"]
+        label[m] = i + 1
+    save_npz(out_path, label)
+    timer.add("encode", time.perf_counter() - t)
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    index, _, count = value.partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard must be i/n, got {value}")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard must satisfy 0 <= i < n, got {value}")
+    return index, count
+
+
+def in_shard(stem: str, shard: tuple[int, int]) -> bool:
+    # hash of name, so split does not depend on listing order or on images
+    # added later, and every node computes it independently
+    index, count = shard
+    return zlib.crc32(stem.encode()) % count == index
+
+
+def process(
+    todo: list[tuple[str, bool, bool]],
+    data_path: Path,
+    weights_path: str,
+    device: str,
+    prefetch: int,
+    io_workers: int,
+    threads: int,
+    worker: int = 0,
+):
+    # one model replica with its own decode/encode pipeline
+    torch.set_num_threads(threads)
+    images_path = data_path / "images"
+    sam_path = data_path / "sam"
+    emb_path = data_path / "embeddings"
+    sam = make_annotator(weights_path, device)
+    timer = StageTimer()
+    decoders = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="decode")
+    encoders = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="encode")
+    decoded: deque[Future] = deque()
+    written: deque[Future] = deque()
+    start = time.perf_counter()
+    for stem, _, _ in todo[:prefetch]:
+        decoded.append(decoders.submit(decode, images_path / f"{stem}.png", timer))
+    for i, (stem, need_mask, need_emb) in enumerate(
+        tqdm(todo, desc=f"worker {worker}", position=worker)
+    ):
+        img = decoded.popleft().result()
+        if i + prefetch < len(todo):
+            next_path = images_path / f"{todo[i + prefetch][0]}.png"
+            decoded.append(decoders.submit(decode, next_path, timer))
+        embedding = None
+        if need_mask:
+            t = time.perf_counter()
+            if need_emb:
+                masks, embedding = sam.generate_with_embedding(img)
+            else:
+                masks = sam.generate(img)
+            timer.add("infer", time.perf_counter() - t)
+            out_path = sam_path / f"{stem}.npz"
+            written.append(
+                encoders.submit(encode, masks, img.shape[:2], out_path, timer)
+            )
+        if need_emb and embedding is None:
+            t = time.perf_counter()
+            sam.predictor.set_image(img)
+            embedding = sam.predictor.get_image_embedding().cpu().numpy()
+            timer.add("embed", time.perf_counter() - t)
+        if need_emb:
+            out_path = emb_path / f"{stem}.npy"
+            written.append(encoders.submit(save_embedding, out_path, embedding))
+        # bounds memory held by masks waiting for encoding
+        while len(written) > io_workers:
+            written.popleft().result()
+    for future in written:
+        future.result()
+    decoders.shutdown()
+    encoders.shutdown()
+    print(f"Worker {worker}, {threads} threads")
+    timer.report(time.perf_counter() - start)
+
+
+def verify(data_path: Path, check_embeddings: bool) -> int:
+    # every image has exactly one readable, up to date output; returns problem count
+    images_path = data_path / "images"
+    stems = sorted(path.stem for path in images_path.glob("*.png"))
+    outputs = [(data_path / "sam", ".npz", ".png")]
+    if check_embeddings:
+        outputs.append((data_path / "embeddings", ".npy", None))
+    problems = 0
+
+    def report(kind: str, path: Path):
+        nonlocal problems
+        problems += 1
+        tqdm.write(f"{kind}: {path}")
+
+    for out_dir, suffix, legacy in outputs:
+        names = set(os.listdir(out_dir)) if out_dir.exists() else set()
+        for stem in tqdm(stems, desc=out_dir.name):
+            out_path = out_dir / f"{stem}{suffix}"
+            if f"{stem}{suffix}" not in names:
+                report("missing", out_path)
+                continue
+            if legacy and f"{stem}{legacy}" in names:
+                report("duplicate", out_dir / f"{stem}{legacy}")
+            if not is_up_to_date(images_path / f"{stem}.png", out_path):
+                report("outdated", out_path)
+            try:
+                if suffix == ".npz":
+                    with np.load(out_path) as npz:
+                        assert "ids" in npz.files
+                else:
+                    np.load(out_path, mmap_mode="r")
+            except Exception:
+                report("unreadable", out_path)
+        known = {f"{stem}{suffix}" for stem in stems}
+        if legacy:
+            known |= {f"{stem}{legacy}" for stem in stems}
+        for name in sorted(names - known):
+            # temp files are left only by interrupted writes
+            kind = "partial" if name.endswith(".tmp") else "orphan"
+            report(kind, out_dir / name)
+    print(f"{len(stems)} images checked, {problems} problems")
+    return problems
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=(0, 1),
+        help="i/n, process only i-th of n hash-based parts of dataset",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="model replicas run by this node"
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=0,
+        help="torch threads per replica (available cores / workers by default)",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="only check that every image has exactly one output",
+    )
+    args = parser.parse_args()
     with open("config.toml", "rb") as f:
         config = tomllib.load(f)
     data_path = Path(config["paths"]["data"])
@@ -35,25 +272,71 @@ if __name__ == "__main__":
     assert (
         images_path.exists()
     ), "Data path must contain 'images' folder with all source data images"
+    # section is missing in config written by older version
+    options = config.get("preprocess", {})
+    save_embeddings = options.get("save_embeddings", False)
+    if args.verify:
+        sys.exit(1 if verify(data_path, save_embeddings) else 0)
+    # fmt: off
+    assert args.workers > 0, f"Number of workers must be positive, but {args.workers} was given"  # noqa: E501
+    # fmt: on
     sam_path = data_path / "sam"
     sam_path.mkdir(exist_ok=True)
-    sam = make_annotator(config["paths"]["sam_weights"], config["device"])
-
-    max_masks = 0
+    emb_path = data_path / "embeddings"
+    if save_embeddings:
+        emb_path.mkdir(exist_ok=True)
+    prefetch = max(1, options.get("prefetch", 2))
+    io_workers = options.get("io_workers", 2)
+    # cores given to this process by scheduler (taskset, cgroups, SLURM)
+    cores = (
+        len(os.sched_getaffinity(0))
+        if hasattr(os, "sched_getaffinity")
+        else os.cpu_count()
+    )
+    threads = args.threads or max(1, cores // args.workers)
 
     img_stems = [path.stem for path in sorted(images_path.iterdir())]
-    for stem in tqdm(img_stems):
-        filename = f"{stem}.png"
-        img_path = images_path / filename
-        out_path = sam_path / filename
-        img = Image.open(img_path)
-        img = np.array(img)
-        masks = sam.generate(img)
-        sorted_masks = sorted(masks, key=(lambda x: x["area"]), reverse=True)
-        label = np.zeros(sorted_masks[0]["segmentation"].shape, dtype=np.uint8)
-        for i, sm in enumerate(sorted_masks):
-            m = sm["segmentation"]
-            label[m] = i + 1
-        max_masks = max(max_masks, np.max(label))
-        label_img = Image.fromarray(label, mode="L")
-        label_img.save(out_path)
+    img_stems = [stem for stem in img_stems if in_shard(stem, args.shard)]
+    todo = []  # (stem, needs mask, needs embedding)
+    for stem in img_stems:
+        img_path = images_path / f"{stem}.png"
+        need_mask = not is_up_to_date(img_path, sam_path / f"{stem}.npz")
+        need_emb = save_embeddings and not is_up_to_date(
+            img_path, emb_path / f"{stem}.npy"
+        )
+        if need_mask or need_emb:
+            todo.append((stem, need_mask, need_emb))
+    print(
+        f"Shard {args.shard[0]}/{args.shard[1]}: {len(img_stems) - len(todo)} "
+        f"samples up to date, {len(todo)} to process"
+    )
+    if not todo:
+        raise SystemExit(0)
+
+    params = (
+        data_path,
+        config["paths"]["sam_weights"],
+        config["device"],
+        prefetch,
+        io_workers,
+        threads,
+    )
+    workers = min(args.workers, len(todo))
+    if workers == 1:
+        process(todo, *params)
+        raise SystemExit(0)
+    # spawn gives each replica fresh torch (and CUDA) state, round-robin
+    # split of sorted stems keeps images of similar size evenly distributed
+    ctx = multiprocessing.get_context("spawn")
+    procs = [
+        ctx.Process(target=process, args=(todo[w::workers], *params, w))
+        for w in range(workers)
+    ]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+    failed = [w for w, proc in enumerate(procs) if proc.exitcode != 0]
+    if failed:
+        print(f"Workers {failed} failed, rerun to process remaining images")
+        raise SystemExit(1)
@@ -0,0 +1,66 @@
+"""
+SAM mask storage shared by preprocessing scripts.
+
+Each mask is saved as compressed .npz holding:
+- ids: 2D segment ids of narrowest type (uint8, uint16 or uint32), 0 is background
+- order_delta: delta coded flat pixel offsets grouped by segment id
+- offsets: start of each segment in order, segment i is order[offsets[i]:offsets[i+1]]
+- bboxes: (x0, y0, x1, y1) per segment, -1 for empty segments
+GUI reads it via SegmentIndex.load without rebuilding the index.
+
+Optional image embeddings for point prompts are saved as float32 .npy
+of (1, 256, 64, 64) shape, GUI memory-maps them.
+"""
+
+from pathlib import Path
+import os
+
+import numpy as np
+
+
+def ids_dtype(num_segments: int) -> type:
+    # narrowest type, uint8 ids are shown by annotator without any conversion
+    if num_segments <= np.iinfo(np.uint8).max:
+        return np.uint8
+    return np.uint16 if num_segments <= np.iinfo(np.uint16).max else np.uint32
+
+
+def save_npz(path: Path, ids: np.ndarray):
+    # temporaries are kept uint32, so peak memory stays near 12 B/px on top of ids
+    flat = ids.ravel()
+    order = np.argsort(flat, kind="stable").astype(np.uint32)
+    counts = np.bincount(flat, minlength=int(flat.max(initial=0)) + 1)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    w = ids.shape[1]
+    bboxes = np.full((len(counts), 4), -1, dtype=np.int32)
+    nonempty = counts > 0
+    starts = offsets[:-1][nonempty]
+    ends = offsets[1:][nonempty] - 1
+    # empty segments have zero length, so runs between non-empty starts are exact
+    xs = np.remainder(order, w, dtype=np.uint32)
+    bboxes[nonempty, 0] = np.minimum.reduceat(xs, starts)
+    bboxes[nonempty, 2] = np.maximum.reduceat(xs, starts)
+    del xs
+    # stable sort keeps rows ascending within segment
+    bboxes[nonempty, 1] = order[starts] // w
+    bboxes[nonempty, 3] = order[ends] // w
+    # offsets ascend within segment, so deltas are small and compress well,
+    # uint32 difference read as int32 is the signed delta
+    order_delta = np.empty(len(order), dtype=np.int32)
+    order_delta[:1] = order[:1]
+    np.subtract(order[1:], order[:-1], out=order_delta[1:].view(np.uint32))
+    # mask appears under its final name only once fully written
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(
+            f, ids=ids, order_delta=order_delta, offsets=offsets, bboxes=bboxes
+        )
+    os.replace(tmp_path, path)
+
+
+def save_embedding(path: Path, embedding: np.ndarray):
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(embedding, dtype=np.float32))
+    os.replace(tmp_path, path)
@@ -0,0 +1,120 @@
+from dataclasses import dataclass
+from pathlib import Path
+import os
+import time
+import uuid
+
+
+@dataclass(frozen=True)
+class Lease:
+    token: str  # unique per session, so owner name may repeat
+    owner: str
+    mtime_ns: int  # bumped by renewals
+
+
+class Claims:
+    # leases of samples kept as <stem>.lock files in folder shared by annotators
+    # lease is created by hard link, which is atomic and fails on existing target
+    # also on network filesystems (NFS, SMB), so only one annotator gets each stem
+    def __init__(self, claim_dir: Path, owner: str, ttl_s: float = 600):
+        # fmt: off
+        assert ttl_s > 0, f"Claim TTL must be positive, but {ttl_s} was given"
+        # fmt: on
+        claim_dir.mkdir(exist_ok=True)
+        self._dir = claim_dir
+        self.owner = owner
+        self.ttl_s = ttl_s
+        self.held: set[str] = set()
+        self._token = uuid.uuid4().hex  # identifies leases of this session
+
+    def _path(self, stem: str) -> Path:
+        return self._dir / f"{stem}.lock"
+
+    def _read(self, path: Path) -> Lease | None:
+        # None if file is missing, lease files of older versions hold owner only
+        try:
+            with open(path, "r") as f:
+                text = f.read()
+                mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        token, _, owner = text.rpartition("\n")
+        return Lease(token, owner, mtime_ns)
+
+    def _is_live(self, lease: Lease) -> bool:
+        return time.time_ns() - lease.mtime_ns < self.ttl_s * 1e9
+
+    def holder(self, stem: str) -> str | None:
+        # owner of live lease of other session
+        lease = self._read(self._path(stem))
+        if lease is None or lease.token == self._token or not self._is_live(lease):
+            return None
+        return lease.owner
+
+    def claim(self, stem: str) -> bool:
+        # also re-validates held lease, it may have expired and been taken over
+        path = self._path(stem)
+        lease = self._read(path)
+        if lease is not None and lease.token == self._token:
+            try:
+                os.utime(path)
+                self.held.add(stem)
+                return True
+            except FileNotFoundError:
+                lease = None  # expired and being taken over right now
+        self.held.discard(stem)
+        if lease is not None:
+            if self._is_live(lease):
+                return False
+            # expired lease, rename succeeds for one of annotators taking it over
+            stale_path = self._dir / f".{stem}.{self._token}.stale"
+            try:
+                os.rename(path, stale_path)
+            except FileNotFoundError:
+                return False
+            if self._read(stale_path) != lease:
+                # lease was renewed or replaced after it was read, it is put
+                # back unless yet another annotator claimed stem meanwhile
+                try:
+                    os.link(stale_path, path)
+                except FileExistsError:
+                    pass
+                stale_path.unlink()
+                return False
+            stale_path.unlink()
+        tmp_path = self._dir / f".{stem}.{self._token}.tmp"
+        tmp_path.write_text(f"{self._token}\n{self.owner}")
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            return False
+        finally:
+            tmp_path.unlink()
+        self.held.add(stem)
+        return True
+
+    def renew(self) -> list[str]:
+        # extends held leases, returns stems taken over by others meanwhile
+        lost = []
+        for stem in list(self.held):
+            lease = self._read(self._path(stem))
+            try:
+                if lease is None or lease.token != self._token:
+                    raise FileNotFoundError
+                os.utime(self._path(stem))
+            except FileNotFoundError:
+                self.held.discard(stem)
+                lost.append(stem)
+        return lost
+
+    def release(self, stem: str):
+        if stem not in self.held:
+            return
+        self.held.discard(stem)
+        lease = self._read(self._path(stem))
+        if lease is not None and lease.token == self._token:
+            self._path(stem).unlink(missing_ok=True)
+
+    def release_all(self):
+        for stem in list(self.held):
+            self.release(stem)
@@ -0,0 +1,145 @@
+from pathlib import Path
+
+from PyQt5.QtCore import Qt, QPointF, QRect, QRectF
+from PyQt5.QtGui import QColor, QImage, QPainter
+import numpy as np
+
+from .label_layer import LabelLayer
+from .profiler import profiled
+
+
+class ClassLabelLayer(LabelLayer):
+    # label is stored as uint8 class ids and rendered through Indexed8 palette
+    def __init__(
+        self, parent, sam_signal, id2color: dict[int, str], history_mb: int = 256
+    ):
+        super().__init__(parent, sam_signal, history_mb)
+        # fmt: off
+        assert all(0 < k < 256 for k in id2color), "Class ids must be in [1, 255] range in class id label mode"  # noqa: E501
+        # fmt: on
+        self._color_table = [0] * 256  # id 0 is transparent background
+        self._color2id = {}
+        for class_id, color in id2color.items():
+            rgba = QColor(color).rgba()
+            self._color_table[class_id] = rgba
+            self._color2id[rgba] = class_id
+        self._class_id = 0
+        self._buffer = np.zeros((0, 0), dtype=np.uint8)
+        self._ids = self._buffer
+        self._view = QImage()
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids
+
+    def set_brush_color(self, color: QColor):
+        super().set_brush_color(color)
+        self._class_id = self._color2id.get(color.rgba(), 0)
+
+    def _allocate(self, w: int, h: int):
+        # Indexed8 scanlines must be 32-bit aligned
+        stride = (w + 3) // 4 * 4
+        self._buffer = np.zeros((h, stride), dtype=np.uint8)
+        self._ids = self._buffer[:, :w]
+        # raw pointer keeps QImage writable, so setColorTable does not detach it
+        self._view = QImage(
+            self._buffer.ctypes.data, w, h, stride, QImage.Format.Format_Indexed8
+        )
+        self._view.setColorTable(self._color_table)
+
+    def _read_region(self, r: QRect) -> np.ndarray:
+        return self._ids[r.top() : r.bottom() + 1, r.left() : r.right() + 1].copy()
+
+    def _write_region(self, r: QRect, pixels: np.ndarray):
+        self._ids[r.top() : r.bottom() + 1, r.left() : r.right() + 1] = pixels
+
+    def _fill_transparent(self):
+        self._ids[:] = 0
+
+    @profiled
+    def _draw_stroke(self, stroke: list[tuple[QPointF, float]]):
+        # rasterize polyline into a small mask around it, then write ids
+        h, w = self._ids.shape
+        r = self._stroke_rect(stroke).intersected(QRect(0, 0, w, h))
+        if r.isEmpty():
+            return
+        self._history.touch(r)
+        mask = QImage(r.size(), QImage.Format.Format_ARGB32_Premultiplied)
+        mask.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(mask)
+        painter.translate(-r.x(), -r.y())
+        self._paint_stroke(painter, stroke, QColor(0, 0, 0))
+        painter.end()
+        buffer = mask.constBits()
+        buffer.setsize(mask.byteCount())
+        argb = np.frombuffer(buffer, dtype=np.uint32).reshape((r.height(), -1))
+        hit = argb[:, : r.width()] >> 24 > 0
+        value = 0 if self._erase_state else self._class_id
+        self._ids[r.top() : r.bottom() + 1, r.left() : r.right() + 1][hit] = value
+        self._dirty = True
+        self.update(QRectF(r))
+
+    @profiled
+    def _draw_bundle(self, bundle: np.ndarray):
+        if len(bundle) == 0:
+            return
+        x0, y0 = bundle.min(axis=0)
+        x1, y1 = bundle.max(axis=0)
+        r = QRect(int(x0), int(y0), int(x1 - x0 + 1), int(y1 - y0 + 1))
+        self._history.touch(r)
+        value = 0 if self._erase_state else self._class_id
+        self._ids[bundle[:, 1], bundle[:, 0]] = value
+        self._dirty = True
+        self.update(QRectF(r))
+
+    def set_image(self, image: QImage):
+        r = self.parentItem().boundingRect().toRect()
+        self.setRect(QRectF(r))
+        self._allocate(r.width(), r.height())
+        self._reset_stroke()
+        self._history.reset(r.width(), r.height())
+        if image.format() == QImage.Format.Format_Indexed8:
+            # remap file palette to class ids by color, file may use its own order
+            lut = np.zeros(256, dtype=np.uint8)
+            for i, rgba in enumerate(image.colorTable()):
+                lut[i] = self._color2id.get(rgba, 0)
+            buffer = image.constBits()
+            buffer.setsize(image.byteCount())
+            src = np.frombuffer(buffer, dtype=np.uint8)
+            src = src.reshape((image.height(), image.bytesPerLine()))
+            self._ids[:] = lut[src[:, : image.width()]]
+        else:
+            image = image.convertToFormat(QImage.Format.Format_ARGB32)
+            buffer = image.constBits()
+            buffer.setsize(image.byteCount())
+            argb = np.frombuffer(buffer, dtype=np.uint32)
+            argb = argb.reshape((image.height(), image.width()))
+            for rgba, class_id in self._color2id.items():
+                self._ids[argb == rgba] = class_id
+        self.update()
+
+    def clear(self):
+        r = self.parentItem().boundingRect().toRect()
+        self.setRect(QRectF(r))
+        self._allocate(r.width(), r.height())
+        self._reset_stroke()
+        self._history.reset(r.width(), r.height())
+        self._dirty = True
+        self.update()  # to make changes be visible instantly
+
+    @profiled
+    def image(self) -> QImage:
+        return self._view.copy()
+
+    @profiled
+    def export_pixmap(self, out_path: Path):
+        self._view.save(str(out_path))
+
+    @profiled
+    def paint(self, painter, option, widget=None):
+        super(LabelLayer, self).paint(painter, option, widget)
+        painter.save()
+        # only exposed part of palette view gets converted to screen format
+        r = option.exposedRect.toAlignedRect().intersected(self._view.rect())
+        painter.drawImage(r.topLeft(), self._view, r)
+        painter.restore()
@@ -0,0 +1,221 @@
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+import json
+import os
+
+from PyQt5.QtGui import QColor, QImage
+import numpy as np
+
+from .components import label_instances, outer_contour
+from .dataset import id_to_color, load_classes
+
+
+def class_map(label: QImage, color2id: dict[int, int]) -> np.ndarray:
+    # (H, W) uint8 class ids, unknown colors and transparent pixels become 0
+    if label.format() == QImage.Format.Format_Indexed8:
+        buffer = label.constBits()
+        buffer.setsize(label.byteCount())
+        idx = np.frombuffer(buffer, dtype=np.uint8)
+        idx = idx.reshape((label.height(), label.bytesPerLine()))[:, : label.width()]
+        lut = np.zeros(256, dtype=np.uint8)
+        for i, color in enumerate(label.colorTable()):
+            lut[i] = color2id.get(color, 0)
+        return lut[idx]
+    label = label.convertToFormat(QImage.Format.Format_ARGB32)
+    buffer = label.constBits()
+    buffer.setsize(label.byteCount())
+    argb = np.frombuffer(buffer, dtype=np.uint32).reshape((label.height(), -1))
+    colors = np.array(sorted(color2id), dtype=np.uint32)
+    ids = np.array([color2id[c] for c in colors], dtype=np.uint8)
+    pos = np.searchsorted(colors, argb).clip(max=len(colors) - 1)
+    return np.where(colors[pos] == argb, ids[pos], 0).astype(np.uint8)
+
+
+def column_runs(inst_map: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # runs of equal instance in column-major (COCO RLE) order, grouped by instance
+    # returns instance, start and end of every foreground run
+    h = inst_map.shape[0]
+    flat = inst_map.T.ravel()
+    change = np.ones(flat.size, dtype=bool)
+    change[1:] = flat[1:] != flat[:-1]
+    change[::h] = True  # runs do not cross columns, so bboxes are simple
+    starts = np.flatnonzero(change)
+    ends = np.append(starts[1:], flat.size)
+    inst = flat[starts]
+    fg = np.flatnonzero(inst > 0)
+    fg = fg[np.argsort(inst[fg], kind="stable")]
+    return inst[fg], starts[fg], ends[fg]
+
+
+def rle_counts(starts: np.ndarray, ends: np.ndarray, size: int) -> list[int]:
+    # COCO RLE counts from sorted runs of one instance, runs continuing
+    # into next column are merged
+    cont = starts[1:] == ends[:-1]
+    run_starts = starts[np.r_[True, ~cont]]
+    run_ends = ends[np.r_[~cont, True]]
+    counts = np.empty(2 * len(run_starts) + 1, dtype=np.int64)
+    counts[0] = run_starts[0]
+    counts[1:-1:2] = run_ends - run_starts
+    counts[2:-1:2] = run_starts[1:] - run_ends[:-1]
+    counts[-1] = size - run_ends[-1]
+    return counts[:-1].tolist() if counts[-1] == 0 else counts.tolist()
+
+
+def rle_string(counts: list[int]) -> str:
+    # compressed counts string, same encoding as pycocotools rleToString,
+    # values are split into 5-bit groups for all counts at once
+    counts = np.asarray(counts, dtype=np.int64)
+    x = counts.copy()
+    x[3:] -= counts[1:-2]
+    active = np.ones(len(x), dtype=bool)
+    chars, valid = [], []
+    while active.any():
+        c = x & 0x1F
+        x >>= 5
+        more = np.where(c & 0x10, x != -1, x != 0)
+        chars.append(np.where(more, c | 0x20, c) + 48)
+        valid.append(active)
+        active = active & more
+    out = np.stack(chars, axis=1)[np.stack(valid, axis=1)]
+    return out.astype(np.uint8).tobytes().decode("ascii")
+
+
+def simplify(points: np.ndarray, tolerance: float) -> np.ndarray:
+    # Douglas-Peucker on closed ring, split at point farthest from the first one
+    n = len(points)
+    if tolerance <= 0 or n < 5:
+        return points
+    ring = np.vstack((points, points[:1])).astype(np.float64)
+    far = int(np.argmax(np.hypot(*(ring[:-1] - ring[0]).T)))
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[far] = True
+    stack = [(0, far), (far, n)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        p, q = ring[i], ring[j]
+        seg = ring[i + 1 : j]
+        dx, dy = q - p
+        norm = np.hypot(dx, dy)
+        if norm == 0:
+            dist = np.hypot(*(seg - p).T)
+        else:
+            dist = np.abs(dx * (seg[:, 1] - p[1]) - dy * (seg[:, 0] - p[0])) / norm
+        k = int(np.argmax(dist))
+        if dist[k] > tolerance:
+            stack += [(i, i + 1 + k), (i + 1 + k, j)]
+            keep[i + 1 + k] = True
+    simplified = points[keep]
+    return simplified if len(simplified) >= 3 else points
+
+
+def sample_annotations(
+    workdir: Path, stem: str, color2id: dict[int, int], mode: str, tolerance: float
+) -> tuple[dict, list[dict]]:
+    # COCO image record and its annotations without ids
+    label = QImage(str(workdir / "labels" / f"{stem}.png"))
+    image = {
+        "file_name": f"{stem}.png",
+        "width": label.width(),
+        "height": label.height(),
+    }
+    if label.isNull():
+        return image, []
+    h, w = label.height(), label.width()
+    inst_map, inst_cls = label_instances(class_map(label, color2id))
+    if len(inst_cls) == 0:
+        return image, []
+    inst, starts, ends = column_runs(inst_map)
+    k = len(inst_cls)
+    first = np.searchsorted(inst, np.arange(1, k + 1))
+    last = np.append(first[1:], len(inst)) - 1
+    # runs of instance are sorted by column, so x range comes from first and last
+    x0, x1 = starts[first] // h, (ends[last] - 1) // h
+    y0 = np.minimum.reduceat(starts % h, first)
+    y1 = np.maximum.reduceat((ends - 1) % h, first)
+    areas = np.add.reduceat(ends - starts, first)
+    annotations = []
+    for i in range(k):
+        bx, by = int(x0[i]), int(y0[i])
+        bw, bh = int(x1[i]) - bx + 1, int(y1[i]) - by + 1
+        if mode == "rle":
+            runs = slice(first[i], last[i] + 1)
+            counts = rle_counts(starts[runs], ends[runs], h * w)
+            segmentation = {"size": [h, w], "counts": rle_string(counts)}
+        else:
+            mask = inst_map[by : by + bh, bx : bx + bw] == i + 1
+            polygon = simplify(outer_contour(mask), tolerance) + (bx, by)
+            segmentation = [polygon.ravel().tolist()]
+        annotations.append(
+            {
+                "category_id": int(inst_cls[i]),
+                "segmentation": segmentation,
+                "area": int(areas[i]),
+                "bbox": [bx, by, bw, bh],
+                "iscrowd": 0,
+            }
+        )
+    return image, annotations
+
+
+def _annotations_chunk(args: tuple) -> list[tuple[dict, list[dict]]]:
+    workdir, stems, color2id, mode, tolerance = args
+    return [
+        sample_annotations(workdir, stem, color2id, mode, tolerance) for stem in stems
+    ]
+
+
+def export_coco(
+    workdir: Path,
+    out_path: Path,
+    workers: int,
+    mode: str = "rle",
+    tolerance: float = 1.0,
+    chunk: int = 16,
+) -> tuple[int, int]:
+    # annotations are streamed to file as chunks complete, returns (images, annotations)
+    # fmt: off
+    assert mode in ("rle", "polygon"), f"Export mode must be either 'rle' or 'polygon', but {mode} was given"  # noqa: E501
+    # fmt: on
+    classes = load_classes(workdir)
+    color2id = {QColor(color).rgba(): i for i, color in id_to_color(classes).items()}
+    categories = [{"id": c["id"], "name": c["name"]} for c in classes]
+    stems = sorted(
+        entry.name[:-4]
+        for entry in os.scandir(workdir / "labels")
+        if entry.name.endswith(".png") and not entry.name.startswith(".")
+    )
+    tasks = [
+        (workdir, stems[i : i + chunk], color2id, mode, tolerance)
+        for i in range(0, len(stems), chunk)
+    ]
+    images = []  # small records, kept to be written after annotations
+    ann_id = 0
+    tmp_path = out_path.with_name(f".{out_path.name}.tmp")
+    with open(tmp_path, "w") as f, ProcessPoolExecutor(max_workers=workers) as pool:
+        f.write(f'{{"categories": {json.dumps(categories)}, "annotations": [')
+
+        def write(future: Future):
+            nonlocal ann_id
+            for image, annotations in future.result():
+                image["id"] = len(images) + 1
+                images.append(image)
+                for ann in annotations:
+                    ann_id += 1
+                    ann["id"] = ann_id
+                    ann["image_id"] = image["id"]
+                    f.write(("," if ann_id > 1 else "") + json.dumps(ann))
+
+        # bounded number of chunks in flight, so memory does not grow with dataset
+        pending: deque[Future] = deque()
+        for task in tasks:
+            pending.append(pool.submit(_annotations_chunk, task))
+            if len(pending) > workers * 2:
+                write(pending.popleft())
+        while pending:
+            write(pending.popleft())
+        f.write(f'], "images": {json.dumps(images)}}}')
+    os.replace(tmp_path, out_path)
+    return len(images), ann_id
@@ -0,0 +1,109 @@
+import numpy as np
+
+# 4-way directions of boundary edges, y axis points down
+EAST, SOUTH, WEST, NORTH = range(4)
+
+
+def run_components(values: np.ndarray) -> tuple[np.ndarray, ...]:
+    # 4-connected components of equal nonzero values, computed on row runs
+    # returns start (flat index), length, value and component root of every run
+    h, w = values.shape
+    flat = values.ravel()
+    change = np.ones(flat.size, dtype=bool)
+    change[1:] = flat[1:] != flat[:-1]
+    change[::w] = True  # every row starts a new run
+    starts = np.flatnonzero(change)
+    lengths = np.diff(np.append(starts, flat.size))
+    run_values = flat[starts]
+    # pairs of equal value runs overlapping in adjacent rows
+    below = np.flatnonzero((starts >= w) & (run_values > 0))
+    first = np.searchsorted(starts, starts[below] - w, "right") - 1
+    last = np.searchsorted(starts, starts[below] + lengths[below] - 1 - w, "right") - 1
+    counts = last - first + 1
+    shift = np.repeat(np.cumsum(counts) - counts, counts)
+    a = np.repeat(below, counts)
+    b = np.repeat(first, counts) + np.arange(counts.sum()) - shift
+    same = run_values[a] == run_values[b]
+    a, b = a[same], b[same]
+    # union-find by min-label hooking and pointer jumping, all vectorized
+    parent = np.arange(len(starts))
+    while True:
+        pa, pb = parent[a], parent[b]
+        if np.array_equal(pa, pb):
+            break
+        m = np.minimum(pa, pb)
+        np.minimum.at(parent, pa, m)
+        np.minimum.at(parent, pb, m)
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+    return starts, lengths, run_values, parent
+
+
+def label_instances(cls: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # returns (H, W) int32 instance map (0 is background) and class of each instance
+    starts, lengths, run_cls, parent = run_components(cls)
+    fg = run_cls > 0
+    roots, inverse = np.unique(parent[fg], return_inverse=True)
+    run_inst = np.zeros(len(starts), dtype=np.int32)
+    run_inst[fg] = inverse + 1
+    inst_map = np.repeat(run_inst, lengths).reshape(cls.shape)
+    return inst_map, run_cls[roots]
+
+
+def boundary_loops(mask: np.ndarray) -> list[np.ndarray]:
+    # pixel corner polygons of all boundaries of mask, pixels are 4-connected
+    m = np.pad(mask, 1)
+    h, w = m.shape
+    ys, xs = [], []
+    dirs = []
+    # boundary edges are directed so that mask stays on the right
+    for d, (dy, dx), (oy, ox) in (
+        (EAST, (-1, 0), (0, 0)),
+        (SOUTH, (0, 1), (0, 1)),
+        (WEST, (1, 0), (1, 1)),
+        (NORTH, (0, -1), (1, 0)),
+    ):
+        ey, ex = np.nonzero(m & ~np.roll(m, (-dy, -dx), axis=(0, 1)))
+        ys.append(ey + oy)
+        xs.append(ex + ox)
+        dirs.append(np.full(len(ey), d))
+    sy, sx, d = np.concatenate(ys), np.concatenate(xs), np.concatenate(dirs)
+    ex = sx + np.array([1, 0, -1, 0])[d]
+    ey = sy + np.array([0, 1, 0, -1])[d]
+    order = np.lexsort((d, sy * w + sx))
+    sy, sx, d, ex, ey = sy[order], sx[order], d[order], ex[order], ey[order]
+    keys = sy * w + sx
+    end_keys = ey * w + ex
+    nxt = np.searchsorted(keys, end_keys, "left")
+    saddle = np.searchsorted(keys, end_keys, "right") - nxt == 2
+    # at diagonal touch turn right, so diagonal pixels stay separate
+    nxt[saddle & (d[nxt] != (d + 1) % 4)] += 1
+    # walk edge cycles, each one is outer boundary or boundary of a hole
+    visited = np.zeros(len(d), dtype=bool)
+    nxt_list = nxt.tolist()
+    loops = []
+    for start in np.flatnonzero(d == EAST).tolist():
+        if visited[start]:
+            continue
+        cycle = [start]
+        i = nxt_list[start]
+        while i != start:
+            cycle.append(i)
+            i = nxt_list[i]
+        cycle = np.array(cycle)
+        visited[cycle] = True
+        corners = cycle[d[cycle] != d[np.roll(cycle, 1)]]
+        loops.append(np.column_stack((sx[corners], sy[corners])) - 1)
+    return loops
+
+
+def outer_contour(mask: np.ndarray) -> np.ndarray:
+    # loop enclosing largest area, holes are dropped
+    def area(loop: np.ndarray) -> float:
+        px, py = loop.T
+        return abs(np.dot(px, np.roll(py, -1)) - np.dot(py, np.roll(px, -1))) / 2
+
+    return max(boundary_loops(mask), key=area)
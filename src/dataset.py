@@ -0,0 +1,12 @@
+from pathlib import Path
+import json
+
+
+def load_classes(workdir: Path) -> list[dict]:
+    # classes.json layout is described in README
+    with open(workdir / "classes.json", "r") as f:
+        return json.load(f)["classes"]
+
+
+def id_to_color(classes: list[dict]) -> dict[int, str]:
+    return {c["id"]: c["color"] for c in classes}
@@ -0,0 +1,137 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import csv
+import json
+import os
+
+from PyQt5.QtGui import QColor, QImage, QImageReader
+import numpy as np
+
+from .dataset import load_classes
+from .segment_index import ids_from_image
+
+
+def color_counts(image: QImage) -> dict[int, int]:
+    # ARGB color -> pixel count, palette images are counted by index in O(n)
+    if image.format() == QImage.Format.Format_Indexed8:
+        buffer = image.constBits()
+        buffer.setsize(image.byteCount())
+        idx = np.frombuffer(buffer, dtype=np.uint8)
+        idx = idx.reshape((image.height(), image.bytesPerLine()))[:, : image.width()]
+        table = image.colorTable()
+        counts: dict[int, int] = {}
+        for i, n in enumerate(np.bincount(idx.ravel(), minlength=256)):
+            if n > 0:
+                color = table[i] if i < len(table) else 0
+                counts[color] = counts.get(color, 0) + int(n)
+        return counts
+    image = image.convertToFormat(QImage.Format.Format_ARGB32)
+    buffer = image.constBits()
+    buffer.setsize(image.byteCount())
+    argb = np.frombuffer(buffer, dtype=np.uint32)
+    colors, counts = np.unique(argb, return_counts=True)
+    return {int(c): int(n) for c, n in zip(colors, counts)}
+
+
+def sam_coverage(sam_dir: Path, stem: str) -> float | None:
+    # share of pixels that belong to any SAM segment
+    npz_path = sam_dir / f"{stem}.npz"
+    png_path = sam_dir / f"{stem}.png"
+    if npz_path.exists():
+        with np.load(npz_path) as data:
+            ids = data["ids"]
+    elif png_path.exists():
+        ids = ids_from_image(QImage(str(png_path)))
+    else:
+        return None
+    return float(np.count_nonzero(ids)) / ids.size
+
+
+def sample_stats(workdir: Path, stem: str, color2name: dict[int, str]) -> dict:
+    label = QImage(str(workdir / "labels" / f"{stem}.png"))
+    if label.isNull():
+        return {"stem": stem, "error": "unreadable label"}
+    total = label.width() * label.height()
+    class_pixels = {name: 0 for name in color2name.values()}
+    unknown: dict[int, int] = {}
+    for color, n in color_counts(label).items():
+        if color >> 24 == 0:
+            continue  # transparent is unlabeled
+        name = color2name.get(color)
+        if name is not None:
+            class_pixels[name] += n
+        else:
+            unknown[color] = n
+    labeled = sum(class_pixels.values()) + sum(unknown.values())
+    image_size = QImageReader(str(workdir / "images" / f"{stem}.png")).size()
+    top_unknown = sorted(unknown.items(), key=lambda kv: kv[1], reverse=True)[:5]
+    return {
+        "stem": stem,
+        "width": label.width(),
+        "height": label.height(),
+        "size_match": image_size == label.size(),
+        "labeled_ratio": labeled / total if total else 0.0,
+        "empty": labeled == 0,
+        "unknown_pixels": sum(unknown.values()),
+        "unknown_colors": [f"#{c:08X}" for c, _ in top_unknown],
+        "sam_coverage": sam_coverage(workdir / "sam", stem),
+        "class_pixels": class_pixels,
+    }
+
+
+def _sample_stats_chunk(args: tuple) -> list[dict]:
+    workdir, stems, color2name = args
+    return [sample_stats(workdir, stem, color2name) for stem in stems]
+
+
+def collect_stats(workdir: Path, workers: int, chunk: int = 64) -> list[dict]:
+    classes = load_classes(workdir)
+    color2name = {QColor(c["color"]).rgba(): c["name"] for c in classes}
+    stems = sorted(
+        entry.name[:-4]
+        for entry in os.scandir(workdir / "labels")
+        if entry.name.endswith(".png") and not entry.name.startswith(".")
+    )
+    # labels are sent in chunks, so per task overhead stays small on 100k+ files
+    tasks = [
+        (workdir, stems[i : i + chunk], color2name) for i in range(0, len(stems), chunk)
+    ]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for part in pool.map(_sample_stats_chunk, tasks):
+            results.extend(part)
+    return results
+
+
+def summarize(results: list[dict]) -> dict:
+    ok = [r for r in results if "error" not in r]
+    class_pixels: dict[str, int] = {}
+    for r in ok:
+        for name, n in r["class_pixels"].items():
+            class_pixels[name] = class_pixels.get(name, 0) + n
+    coverages = [r["sam_coverage"] for r in ok if r["sam_coverage"] is not None]
+    return {
+        "labels": len(results),
+        "unreadable": [r["stem"] for r in results if "error" in r],
+        "empty": [r["stem"] for r in ok if r["empty"]],
+        "unknown_colors": [r["stem"] for r in ok if r["unknown_pixels"] > 0],
+        "size_mismatch": [r["stem"] for r in ok if not r["size_match"]],
+        "class_pixels": class_pixels,
+        "mean_sam_coverage": sum(coverages) / len(coverages) if coverages else None,
+    }
+
+
+def write_report(results: list[dict], out_dir: Path):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with open(out_dir / "stats.json", "w") as f:
+        json.dump({"summary": summarize(results), "samples": results}, f, indent=2)
+    ok = [r for r in results if "error" not in r]
+    names = list(ok[0]["class_pixels"]) if ok else []
+    columns = ["stem", "width", "height", "size_match", "labeled_ratio", "empty"]
+    columns += ["unknown_pixels", "sam_coverage"]
+    with open(out_dir / "stats.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns + names)
+        for r in ok:
+            row = [r[c] for c in columns]
+            writer.writerow(row + [r["class_pixels"][n] for n in names])
@@ -0,0 +1,161 @@
+from PyQt5.QtCore import (
+    Qt,
+    QAbstractListModel,
+    QModelIndex,
+    QPoint,
+    QRect,
+    QSize,
+    pyqtSignal,
+    pyqtSlot,
+)
+from PyQt5.QtGui import QColor, QPainter, QPaintEvent, QWheelEvent
+from PyQt5.QtWidgets import (
+    QAbstractItemView,
+    QListView,
+    QStyle,
+    QStyledItemDelegate,
+    QStyleOptionViewItem,
+)
+
+from .manifest import DONE, IN_PROGRESS, UNLABELED
+from .thumbnail_cache import ThumbnailCache
+
+STATUS_ROLE = Qt.ItemDataRole.UserRole
+STATUS_COLORS = {UNLABELED: "#808080", IN_PROGRESS: "#FFC000", DONE: "#00C000"}
+
+
+class FilmstripModel(QAbstractListModel):
+    # emitted by thumbnail threads, and on status change; unlike dataChanged
+    # it makes view repaint one item without laying out all of them again
+    row_changed = pyqtSignal(int)
+
+    def __init__(
+        self,
+        stems: list[str],
+        statuses: list[int],
+        thumbnails: ThumbnailCache,
+        parent=None,
+    ):
+        super().__init__(parent)
+        self._stems = stems
+        self._statuses = statuses
+        self._thumbnails = thumbnails
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._stems)
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        # view asks only for rows it paints, so only visible thumbnails are loaded
+        row = index.row()
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self._stems[row]
+        if role == Qt.ItemDataRole.DecorationRole:
+            return self._thumbnails.get(row, self.row_changed.emit)
+        if role == STATUS_ROLE:
+            return self._statuses[row]
+        return None
+
+    def set_status(self, row: int, status: int):
+        self._statuses[row] = status
+        self.row_changed.emit(row)
+
+    def set_wanted(self, first: int, last: int):
+        self._thumbnails.set_wanted(first, last)
+
+
+class FilmstripDelegate(QStyledItemDelegate):
+    # thumbnail with status badge and name below
+    def __init__(self, size: int, parent=None):
+        super().__init__(parent)
+        self._size = size
+        self._margin = 4
+        self._badge = max(8, size // 8)
+
+    def sizeHint(self, option: QStyleOptionViewItem, index: QModelIndex) -> QSize:
+        side = self._size + 2 * self._margin
+        return QSize(side, side + option.fontMetrics.height())
+
+    def paint(
+        self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex
+    ):
+        painter.save()
+        if option.state & QStyle.StateFlag.State_Selected:
+            painter.fillRect(option.rect, option.palette.highlight())
+        r = option.rect.adjusted(self._margin, self._margin, -self._margin, 0)
+        thumb_rect = QRect(r.x(), r.y(), self._size, self._size)
+        image = index.data(Qt.ItemDataRole.DecorationRole)
+        if image is None:
+            painter.fillRect(thumb_rect, QColor(70, 70, 70))
+        else:
+            target = QRect(QPoint(), image.size())
+            target.moveCenter(thumb_rect.center())
+            painter.drawImage(target, image)
+        # status badge in top right corner
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setPen(QColor(30, 30, 30))
+        painter.setBrush(QColor(STATUS_COLORS[index.data(STATUS_ROLE)]))
+        x = thumb_rect.right() - self._badge - 2
+        painter.drawEllipse(x, thumb_rect.top() + 2, self._badge, self._badge)
+        text_rect = QRect(
+            r.x(), thumb_rect.bottom(), r.width(), r.bottom() - thumb_rect.bottom()
+        )
+        text = option.fontMetrics.elidedText(
+            index.data(Qt.ItemDataRole.DisplayRole),
+            Qt.TextElideMode.ElideMiddle,
+            text_rect.width(),
+        )
+        painter.setPen(option.palette.text().color())
+        painter.drawText(text_rect, Qt.AlignmentFlag.AlignCenter, text)
+        painter.restore()
+
+
+class Filmstrip(QListView):
+    # virtualized horizontal strip of samples, uniform item sizes let Qt skip
+    # measuring every row, so it stays fast with hundreds of thousands of them
+    sample_clicked = pyqtSignal(int)
+
+    def __init__(self, model: FilmstripModel, size: int, parent=None):
+        super().__init__(parent)
+        self.setModel(model)
+        self.setItemDelegate(FilmstripDelegate(size, self))
+        self.setFlow(QListView.Flow.LeftToRight)
+        self.setWrapping(False)
+        self.setUniformItemSizes(True)
+        self.setHorizontalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.setFocusPolicy(Qt.FocusPolicy.NoFocus)  # keeps shortcuts in main window
+        item_height = size + 8 + self.fontMetrics().height()
+        self.setFixedHeight(
+            item_height + self.horizontalScrollBar().sizeHint().height() + 4
+        )
+        self.clicked.connect(lambda index: self.sample_clicked.emit(index.row()))
+        model.row_changed.connect(
+            self.on_row_changed, Qt.ConnectionType.QueuedConnection
+        )
+
+    @pyqtSlot(int)
+    def on_row_changed(self, row: int):
+        self.viewport().update(self.visualRect(self.model().index(row)))
+
+    def set_current(self, row: int):
+        index = self.model().index(row)
+        self.setCurrentIndex(index)
+        self.scrollTo(index, QAbstractItemView.ScrollHint.PositionAtCenter)
+
+    def wheelEvent(self, e: QWheelEvent) -> None:
+        # vertical wheel scrolls strip sideways
+        bar = self.horizontalScrollBar()
+        bar.setValue(bar.value() - e.angleDelta().y() - e.angleDelta().x())
+
+    def paintEvent(self, e: QPaintEvent) -> None:
+        # thumbnails requested for rows scrolled out of view are not built
+        y = self.viewport().height() // 2
+        first = self.indexAt(QPoint(0, y))
+        last = self.indexAt(QPoint(self.viewport().width() - 1, y))
+        count = self.model().rowCount()
+        self.model().set_wanted(
+            first.row() if first.isValid() else 0,
+            last.row() if last.isValid() else count - 1,
+        )
+        super().paintEvent(e)
@@ -0,0 +1,53 @@
+import numpy as np
+
+from .components import run_components
+
+
+def similar_mask(pixels: np.ndarray, seed: int, tolerance: int) -> np.ndarray:
+    # pixels of (H, W) uint32 RGB32 image whose every channel is within tolerance,
+    # alpha of RGB32 is always 0xFF, so it passes too
+    # (x - lo) wraps around in uint8, so one compare checks lo <= x <= hi
+    channels = np.frombuffer(np.uint32(seed).tobytes(), dtype=np.uint8).astype(int)
+    lo = np.clip(channels - tolerance, 0, 255).astype(np.uint8)
+    span = (np.clip(channels + tolerance, 0, 255) - lo).astype(np.uint8)
+    # bounds are tiled along whole row, so numpy loops run over long rows, not 4 bytes
+    h, w = pixels.shape
+    d = pixels.view(np.uint8).reshape(h, 4 * w) - np.tile(lo, w)
+    ok = np.less_equal(d, np.tile(span, w), out=d.view(bool))  # in place
+    return ok.view(np.uint32) == 0x01010101
+
+
+def flood_fill(
+    pixels: np.ndarray, x: int, y: int, tolerance: int, window: int = 512
+) -> np.ndarray:
+    # 4-connected region of similar color around (x, y) as (N, 2) array of (x, y)
+    # starts in a window around the click and grows it only while region reaches
+    # its inner edges, so small regions cost the same on any image size
+    h, w = pixels.shape
+    if not (0 <= x < w and 0 <= y < h):
+        return np.empty((0, 2), dtype=np.int64)
+    seed = pixels[y, x]
+    r = window // 2
+    while True:
+        x0, y0 = max(x - r, 0), max(y - r, 0)
+        x1, y1 = min(x + r, w), min(y + r, h)
+        ww = x1 - x0
+        mask = similar_mask(pixels[y0:y1, x0:x1], seed, tolerance)
+        starts, lengths, _, parent = run_components(mask.view(np.uint8))
+        seed_run = np.searchsorted(starts, (y - y0) * ww + (x - x0), "right") - 1
+        region = parent == parent[seed_run]
+        starts, lengths = starts[region], lengths[region]
+        rows, cols = np.divmod(starts, ww)
+        grow = (
+            (x0 > 0 and np.any(cols == 0))
+            or (x1 < w and np.any(cols + lengths == ww))
+            or (y0 > 0 and np.any(rows == 0))
+            or (y1 < h and np.any(rows == y1 - y0 - 1))
+        )
+        if not grow:
+            break
+        r *= 4
+    shift = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    flat = np.repeat(starts, lengths) + np.arange(lengths.sum()) - shift
+    ys, xs = np.divmod(flat, ww)
+    return np.column_stack((xs + x0, ys + y0))
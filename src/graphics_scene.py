@@ -1,16 +1,20 @@
 from pathlib import Path
 
-from PyQt5.QtGui import QColor
+from PyQt5.QtGui import QColor, QImage, QPixmap, QTransform
 from PyQt5.QtWidgets import (
-    QGraphicsScene,
     QGraphicsPixmapItem,
+    QGraphicsScene,
     QGraphicsSceneMouseEvent,
 )
-from PyQt5.QtCore import pyqtSignal, QPointF
+from PyQt5.QtCore import Qt, pyqtSignal, QPointF, QRectF
 
 from .brush_cursor import BrushCursor
+from .class_label_layer import ClassLabelLayer
+from .image_item import ImageItem
 from .label_layer import LabelLayer
+from .prompt_decoder import PromptDecoder
 from .sam_layer import SamLayer
+from .segment_outline import SegmentOutline
 
 import numpy as np
 
@@ -19,26 +23,97 @@ class GraphicsScene(QGraphicsScene):
     label2sam_signal = pyqtSignal(QPointF)
     sam2label_signal = pyqtSignal(np.ndarray)
 
-    def __init__(self, parent):
+    def __init__(
+        self,
+        parent,
+        class_colors: dict[int, str] | None = None,
+        history_mb: int = 256,
+        decoder: PromptDecoder | None = None,
+    ):
         super().__init__(parent)
         self._brush_size = 50
         self._brush_step = 5
         self._brush_limits = (1, 150)
-
-        self.image_item = QGraphicsPixmapItem()
-        self.sam_item = SamLayer(self.image_item, self.sam2label_signal)
-        self.label_item = LabelLayer(self.image_item, self.label2sam_signal)
+        self._sam_mode = False
+        self._hover_mode = True
+
+        self.image_item = ImageItem()
+        self.sam_item = SamLayer(self.image_item, self.sam2label_signal, decoder)
+        if class_colors is None:
+            self.label_item = LabelLayer(
+                self.image_item, self.label2sam_signal, history_mb
+            )
+        else:
+            self.label_item = ClassLabelLayer(
+                self.image_item, self.label2sam_signal, class_colors, history_mb
+            )
+        self.outline_item = SegmentOutline(self.image_item)
         self.cursor_item = BrushCursor(self.image_item)
 
         self.label2sam_signal.connect(self.sam_item.handle_click)
         self.sam2label_signal.connect(self.label_item.handle_bundle)
+        if decoder is not None:
+            decoder.mask_ready.connect(self.handle_prompt_mask)
 
         self.addItem(self.image_item)
 
+        # stands in for image and layers until full resolution sample is loaded
+        self.preview_item = QGraphicsPixmapItem()
+        self.preview_item.setTransformationMode(
+            Qt.TransformationMode.SmoothTransformation
+        )
+        self.preview_item.setAcceptedMouseButtons(Qt.MouseButton.NoButton)
+        self.preview_item.hide()
+        self.addItem(self.preview_item)
+
+    def show_preview(self, image: QImage, width: int, height: int):
+        # layers are children of image item, so hiding it disables drawing
+        self.preview_item.setPixmap(QPixmap.fromImage(image))
+        self.preview_item.setTransform(
+            QTransform.fromScale(width / image.width(), height / image.height())
+        )
+        self.preview_item.show()
+        self.image_item.hide()
+        self.setSceneRect(QRectF(0, 0, width, height))
+
+    def hide_preview(self):
+        self.preview_item.hide()
+        self.preview_item.setPixmap(QPixmap())
+        self.image_item.show()
+
+    def is_preview(self) -> bool:
+        return self.preview_item.isVisible()
+
     def handle_sam_mode(self, is_sam: bool):
         self.sam_item.handle_sam_mode(is_sam)
         self.label_item.handle_sam_mode(is_sam)
         self._sam_mode = is_sam
+        self.outline_item.clear()
+
+    def handle_prompt_mode(self, is_prompt: bool):
+        self.sam_item.handle_prompt_mode(is_prompt)
+        self.label_item.handle_prompt_mode(is_prompt)
+        self.outline_item.clear()
+
+    def handle_prompt_mask(self, session: int, bundle: np.ndarray):
+        # masks still in flight may belong to previous sample, possibly larger one
+        if self.is_preview() or not self.sam_item.is_current_prompt(session):
+            return
+        self.label_item.handle_prompt_mask(session, bundle)
+
+    def handle_hover_mode(self, is_hover: bool):
+        self._hover_mode = is_hover
+        self.outline_item.clear()
+
+    def _update_hover(self, pos: QPointF):
+        # O(1) id lookup per move, path is rebuilt only when segment changes
+        seg_id = self.sam_item.hover_segment(pos) if self._hover_mode else 0
+        if seg_id == self.outline_item.segment:
+            return
+        if seg_id == 0:
+            self.outline_item.clear()
+        else:
+            self.outline_item.set_segment(seg_id, self.sam_item.outline(seg_id))
 
     def set_eraser(self, value):
         self.label_item.set_eraser(value)
@@ -69,6 +144,8 @@ class GraphicsScene(QGraphicsScene):
 
     def mouseMoveEvent(self, event: QGraphicsSceneMouseEvent) -> None:
         self.cursor_item.setPos(event.scenePos())
+        if self._sam_mode and not self.is_preview():
+            self._update_hover(event.scenePos())
         super().mouseMoveEvent(event)
 
     def save_label(self, label_path: Path):
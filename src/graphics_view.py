@@ -2,16 +2,15 @@ from pathlib import Path
 
 from PyQt5.QtCore import (
     Qt,
+    QEvent,
     pyqtSlot,
     QPoint,
-    QRectF,
-    QPointF,
-    QSizeF,
 )
 from PyQt5.QtGui import (
     QColor,
-    QPixmap,
+    QImage,
     QMouseEvent,
+    QTabletEvent,
     QWheelEvent,
     QBrush,
     QPainter,
@@ -19,16 +18,28 @@ from PyQt5.QtGui import (
 from PyQt5.QtWidgets import QFrame, QGraphicsView
 
 from .graphics_scene import GraphicsScene
+from .profiler import profiled
+from .sample_loader import Preview, Sample
 
 
 class GraphicsView(QGraphicsView):
-    def __init__(self, brush_feedback, parent=None):
+    def __init__(
+        self,
+        brush_feedback,
+        parent=None,
+        class_colors=None,
+        history_mb=256,
+        pen_pressure=False,
+        decoder=None,
+    ):
         super().__init__(parent)
-        self._scene = GraphicsScene(self)
+        self._scene = GraphicsScene(self, class_colors, history_mb, decoder)
         self._pan_mode = False
         self._last_pos = QPoint()
         self._brush_feedback = brush_feedback
         self._sam_mode = False
+        self._pen_pressure = pen_pressure
+        self._preview_stem = None
 
         self.setScene(self._scene)
         self.setTransformationAnchor(QGraphicsView.ViewportAnchor.AnchorUnderMouse)
@@ -52,6 +63,22 @@ class GraphicsView(QGraphicsView):
         self._sam_mode = is_sam
         self._scene.handle_sam_mode(is_sam)
 
+    def set_prompt_mode(self, is_prompt: bool):
+        self._scene.handle_prompt_mode(is_prompt)
+
+    def reset_prompt(self):
+        self._scene.sam_item.reset_prompt()
+
+    def set_wand_mode(self, is_wand: bool):
+        self._scene.sam_item.handle_wand_mode(is_wand)
+        self._scene.outline_item.clear()
+
+    def set_hover_mode(self, is_hover: bool):
+        self._scene.handle_hover_mode(is_hover)
+
+    def set_wand_tolerance(self, value: int):
+        self._scene.sam_item.set_wand_tolerance(value)
+
     def set_brush_color(self, color: QColor):
         self._scene.set_brush_color(color)
 
@@ -62,24 +89,77 @@ class GraphicsView(QGraphicsView):
         self._scene.set_eraser(value)
 
     def reset_zoom(self):
-        self.fitInView(self._scene.image_item, Qt.AspectRatioMode.KeepAspectRatio)
+        self.fitInView(self._scene.sceneRect(), Qt.AspectRatioMode.KeepAspectRatio)
 
+    # label edits wait until full resolution label is loaded
     def clear_label(self):
-        self._scene.label_item.clear()
+        if not self.is_preview():
+            self._scene.label_item.erase_all()
+
+    def undo(self):
+        if not self.is_preview():
+            self._scene.label_item.undo()
+
+    def redo(self):
+        if not self.is_preview():
+            self._scene.label_item.redo()
+
+    def is_preview(self) -> bool:
+        return self._scene.is_preview()
 
     def save_label_to(self, path: Path):
         self._scene.save_label(path)
 
-    def load_sample(self, image_path: Path, label_path: Path, sam_path: Path):
-        image = QPixmap(str(image_path))
-        self._scene.setSceneRect(QRectF(QPointF(), QSizeF(image.size())))
-        self._scene.image_item.setPixmap(QPixmap(str(image_path)))
-        if label_path.exists():
-            self._scene.label_item.set_image(str(label_path))
+    def label_image(self) -> QImage:
+        return self._scene.label_item.image()
+
+    def is_label_dirty(self) -> bool:
+        return self._scene.label_item.is_dirty()
+
+    def mark_label_saved(self):
+        self._scene.label_item.mark_saved()
+
+    @profiled
+    def load_preview(self, preview: Preview):
+        # label is blended in once here, so preview is a single pixmap
+        image = preview.image.convertToFormat(QImage.Format.Format_RGB32)
+        if preview.label is not None:
+            painter = QPainter(image)
+            painter.setOpacity(self._scene.label_item.opacity())
+            painter.drawImage(image.rect(), preview.label)
+            painter.end()
+        self._scene.show_preview(image, preview.width, preview.height)
+        self._scene.outline_item.clear()
+        self._preview_stem = preview.stem
+        self.setCursor(Qt.CursorShape.BusyCursor)
+        self.fitInView(self._scene.sceneRect(), Qt.AspectRatioMode.KeepAspectRatio)
+
+    @profiled
+    def load_sample(self, sample: Sample):
+        # zoom and position chosen on preview of the same sample are kept
+        keep_view = self.is_preview() and self._preview_stem == sample.stem
+        self._scene.hide_preview()
+        self._preview_stem = None
+        if not self._pan_mode:
+            self.setCursor(Qt.CursorShape.BlankCursor)
+        if sample.pyramid is not None:
+            self._scene.image_item.set_pyramid(sample.pyramid)
+        else:
+            self._scene.image_item.set_image(sample.image)
+        self._scene.setSceneRect(self._scene.image_item.boundingRect())
+        if sample.label is not None:
+            self._scene.label_item.set_image(sample.label)
         else:
             self._scene.label_item.clear()
-        if sam_path.exists():
-            self._scene.sam_item.set_image(str(sam_path))
+        self._scene.label_item.mark_saved()
+        self._scene.outline_item.clear()
+        if sample.sam_index is not None:
+            self._scene.sam_item.set_index(sample.sam_index)
+        else:
+            self._scene.sam_item.clear()
+        self._scene.sam_item.set_embedding(sample.embedding)
+        if keep_view:
+            return
         self.fitInView(self._scene.image_item, Qt.AspectRatioMode.KeepAspectRatio)
         self.centerOn(self._scene.image_item)
 
@@ -89,6 +169,12 @@ class GraphicsView(QGraphicsView):
         self.horizontalScrollBar().setValue(h_val)
         self.verticalScrollBar().setValue(v_val)
 
+    def tabletEvent(self, event: QTabletEvent) -> None:
+        if self._pen_pressure:
+            release = event.type() == QEvent.Type.TabletRelease
+            self._scene.label_item.set_pressure(1.0 if release else event.pressure())
+        event.ignore()  # Qt then delivers it again as a mouse event
+
     def mousePressEvent(self, event: QMouseEvent) -> None:
         if event.button() == Qt.MouseButton.RightButton:
             self._pan_mode = True
@@ -107,7 +193,10 @@ class GraphicsView(QGraphicsView):
     def mouseReleaseEvent(self, event: QMouseEvent) -> None:
         if event.button() == Qt.MouseButton.RightButton:
             self._pan_mode = False
-            self.setCursor(Qt.CursorShape.BlankCursor)
+            preview = self.is_preview()
+            self.setCursor(
+                Qt.CursorShape.BusyCursor if preview else Qt.CursorShape.BlankCursor
+            )
         super().mouseReleaseEvent(event)
 
     def wheelEvent(self, event: QWheelEvent) -> None:
@@ -0,0 +1,81 @@
+import math
+
+from PyQt5.QtCore import QRectF
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import QGraphicsItem, QGraphicsPixmapItem
+import numpy as np
+
+from .profiler import profiled
+from .tile_pyramid import TilePixels, TilePyramid
+
+
+class ImageItem(QGraphicsPixmapItem):
+    # shows either a plain pixmap or visible tiles of a pyramid at current zoom
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
+        self._pyramid = None
+        self._image = None  # source of pixels() for color wand
+        self._pixels = None
+
+    def setPixmap(self, pixmap: QPixmap):
+        self.prepareGeometryChange()
+        self._pyramid = None
+        self._image = None
+        self._pixels = None
+        super().setPixmap(pixmap)
+
+    def set_image(self, image: QImage):
+        self.setPixmap(QPixmap.fromImage(image))
+        self._image = image
+
+    def set_pyramid(self, pyramid: TilePyramid):
+        self.prepareGeometryChange()
+        super().setPixmap(QPixmap())
+        self._pyramid = pyramid
+        self._image = None
+        self._pixels = None
+        self.update()
+
+    def pixels(self) -> np.ndarray | TilePixels | None:
+        # (H, W) uint32 RGB32 view of full resolution image, made on first use,
+        # pyramid tiles are read only for windows the wand asks for
+        if self._pixels is None:
+            if self._pyramid is not None:
+                self._pixels = TilePixels(self._pyramid)
+                return self._pixels
+            if self._image is None:
+                return None
+            # no copy if image is already 32-bit
+            self._image = self._image.convertToFormat(QImage.Format.Format_RGB32)
+            buffer = self._image.constBits()
+            buffer.setsize(self._image.byteCount())
+            self._pixels = np.frombuffer(buffer, dtype=np.uint32).reshape(
+                (self._image.height(), self._image.width())
+            )
+        return self._pixels
+
+    def boundingRect(self) -> QRectF:
+        if self._pyramid is None:
+            return super().boundingRect()
+        return QRectF(0, 0, self._pyramid.width, self._pyramid.height)
+
+    @profiled
+    def paint(self, painter, option, widget=None):
+        if self._pyramid is None:
+            return super().paint(painter, option, widget)
+        lod = option.levelOfDetailFromTransform(painter.worldTransform())
+        level = self._pyramid.level_for(lod)
+        scale = 2**level
+        span = self._pyramid.tile_size * scale  # tile side in scene units
+        r = option.exposedRect.intersected(self.boundingRect())
+        painter.save()
+        painter.setClipRect(self.boundingRect())
+        for ty in range(int(r.top() // span), math.ceil(r.bottom() / span)):
+            for tx in range(int(r.left() // span), math.ceil(r.right() / span)):
+                tile = self._pyramid.tile(level, tx, ty)
+                target = QRectF(
+                    tx * span, ty * span, tile.width() * scale, tile.height() * scale
+                )
+                painter.drawImage(target, tile)
+        painter.restore()
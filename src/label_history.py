@@ -0,0 +1,145 @@
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+import zlib
+
+from PyQt5.QtCore import QRect
+import numpy as np
+
+
+@dataclass
+class TileDelta:
+    rect: QRect
+    dtype: np.dtype
+    blob: bytes  # zlib compressed XOR of tile before and after the edit
+
+
+@dataclass
+class HistoryStep:
+    deltas: list[TileDelta]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(d.blob) for d in self.deltas)
+
+    def bounding_rect(self) -> QRect:
+        r = QRect()
+        for d in self.deltas:
+            r = r.united(d.rect)
+        return r
+
+
+class LabelHistory:
+    # undo/redo of label edits kept as compressed XOR deltas of touched tiles only
+    def __init__(
+        self,
+        read: Callable[[QRect], np.ndarray],
+        write: Callable[[QRect, np.ndarray], None],
+        budget_mb: int = 256,
+        tile_size: int = 128,
+    ):
+        self._read = read
+        self._write = write
+        self._budget = budget_mb * 1024 * 1024
+        self._tile_size = tile_size
+        self._bounds = QRect()
+        self._undo: deque[HistoryStep] = deque()
+        self._redo: list[HistoryStep] = []
+        self._bytes = 0
+        self._before: dict[tuple[int, int], np.ndarray] | None = None  # open step
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def can_undo(self) -> bool:
+        return len(self._undo) > 0
+
+    def can_redo(self) -> bool:
+        return len(self._redo) > 0
+
+    def is_open(self) -> bool:
+        return self._before is not None
+
+    def last_step(self) -> HistoryStep | None:
+        return self._undo[-1] if self._undo else None
+
+    def reset(self, width: int, height: int):
+        self._bounds = QRect(0, 0, width, height)
+        self._undo.clear()
+        self._redo.clear()
+        self._bytes = 0
+        self._before = None
+
+    def _tile_rect(self, tx: int, ty: int) -> QRect:
+        s = self._tile_size
+        return QRect(tx * s, ty * s, s, s).intersected(self._bounds)
+
+    def begin(self):
+        if self._before is not None:
+            self.commit()
+        self._before = {}
+
+    def touch(self, rect: QRect):
+        # saves tiles under rect before they get modified for the first time in step
+        if self._before is None:
+            return
+        r = rect.intersected(self._bounds)
+        if r.isEmpty():
+            return
+        s = self._tile_size
+        for ty in range(r.top() // s, r.bottom() // s + 1):
+            for tx in range(r.left() // s, r.right() // s + 1):
+                if (tx, ty) not in self._before:
+                    self._before[(tx, ty)] = self._read(self._tile_rect(tx, ty))
+
+    def commit(self):
+        if self._before is None:
+            return
+        deltas = []
+        for (tx, ty), before in self._before.items():
+            rect = self._tile_rect(tx, ty)
+            diff = np.bitwise_xor(before, self._read(rect))
+            if diff.any():
+                deltas.append(TileDelta(rect, diff.dtype, zlib.compress(diff, 1)))
+        self._before = None
+        if not deltas:
+            return
+        self._drop_redo()
+        step = HistoryStep(deltas)
+        self._undo.append(step)
+        self._bytes += step.nbytes
+        while self._bytes > self._budget and self._undo:
+            self._bytes -= self._undo.popleft().nbytes
+
+    def _drop_redo(self):
+        for step in self._redo:
+            self._bytes -= step.nbytes
+        self._redo.clear()
+
+    def _apply(self, step: HistoryStep):
+        # XOR delta is its own inverse, so undo and redo are the same operation
+        for d in step.deltas:
+            diff = np.frombuffer(zlib.decompress(d.blob), dtype=d.dtype)
+            pixels = self._read(d.rect)
+            pixels ^= diff.reshape(pixels.shape)
+            self._write(d.rect, pixels)
+
+    def undo(self) -> QRect | None:
+        # returns region to repaint, None if there is nothing to undo
+        self.commit()
+        if not self._undo:
+            return None
+        step = self._undo.pop()
+        self._apply(step)
+        self._redo.append(step)
+        return step.bounding_rect()
+
+    def redo(self) -> QRect | None:
+        self.commit()
+        if not self._redo:
+            return None
+        step = self._redo.pop()
+        self._apply(step)
+        self._undo.append(step)
+        return step.bounding_rect()
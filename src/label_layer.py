@@ -1,25 +1,57 @@
 from pathlib import Path
 
-from PyQt5.QtCore import Qt, QLineF, QPoint, QRectF
-from PyQt5.QtWidgets import QGraphicsSceneMouseEvent, QGraphicsRectItem
-from PyQt5.QtGui import QColor, QPixmap, QPainter, QPen
+from PyQt5.QtCore import Qt, QPointF, QRect, QRectF, QTimer
+from PyQt5.QtWidgets import (
+    QGraphicsItem,
+    QGraphicsSceneMouseEvent,
+    QGraphicsRectItem,
+)
+from PyQt5.QtGui import QColor, QImage, QPainter, QPen
 import numpy as np
 
+from .label_history import LabelHistory
+from .profiler import profiled
+
+TILE_SIZE = 256  # multiple of history tile size, so history tiles never straddle
+
+
+def tile_pixels(tile: QImage) -> np.ndarray:
+    # writable (H, W) uint32 view of 32-bit tile
+    buffer = tile.bits()
+    buffer.setsize(tile.byteCount())
+    return np.frombuffer(buffer, dtype=np.uint32).reshape((tile.height(), -1))
+
 
 class LabelLayer(QGraphicsRectItem):
-    def __init__(self, parent, sam_signal):
+    def __init__(self, parent, sam_signal, history_mb: int = 256):
         super().__init__(parent)
         self.setOpacity(0.5)
         self.setPen(QPen(Qt.PenStyle.NoPen))
         self.setAcceptedMouseButtons(Qt.MouseButton.LeftButton)
+        # makes option.exposedRect hold the dirty region in paint()
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
 
         self._sam_signal = sam_signal
         self._erase_state = False
         self._brush_color = QColor(0, 0, 0)
         self._brush_size = 50
-        self._pixmap = QPixmap()
-        self._line = QLineF()
+        # label is split into tiles allocated on first paint over them, so
+        # memory grows with labeled area instead of image size
+        self._tiles: dict[tuple[int, int], QImage] = {}
+        self._pressure = 1.0  # from tablet events, scales brush size
+        self._stroke: list[tuple[QPointF, float]] = []  # points not yet drawn
+        # move events are coalesced and drawn as one polyline about once per frame
+        self._flush_timer = QTimer()
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(16)
+        self._flush_timer.timeout.connect(self._flush_stroke)
         self._sam_mode = False
+        self._prompt_mode = False  # clicks place SAM prompt points instead of brush
+        self._prompt_session = None
+        self._prompt_step = None  # history step holding mask of last prompt click
+        self._deferred_prompt = None  # mask arrived while mouse button was down
+        self._dirty = False  # label differs from what was loaded or last saved
+        self._history = LabelHistory(self._read_region, self._write_region, history_mb)
 
     def set_brush_color(self, color: QColor):
         self.set_eraser(False)
@@ -31,66 +63,288 @@ class LabelLayer(QGraphicsRectItem):
     def set_size(self, size: int):
         self._brush_size = size
 
-    def _draw_line(self):
-        painter = QPainter(self._pixmap)
-        if self._erase_state:
-            painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Clear)
-        pen = QPen(self._brush_color, self._brush_size)
+    def set_pressure(self, pressure: float):
+        self._pressure = pressure
+
+    def _stroke_size(self) -> float:
+        return max(1.0, self._brush_size * self._pressure)
+
+    def _stroke_rect(self, stroke: list[tuple[QPointF, float]]) -> QRect:
+        # bounding rect of polyline grown by largest brush radius
+        xs = [p.x() for p, _ in stroke]
+        ys = [p.y() for p, _ in stroke]
+        pad = int(max(size for _, size in stroke)) // 2 + 1
+        r = QRectF(QPointF(min(xs), min(ys)), QPointF(max(xs), max(ys)))
+        return r.toAlignedRect().adjusted(-pad, -pad, pad, pad)
+
+    def _paint_stroke(self, painter: QPainter, stroke: list, color: QColor):
+        pen = QPen(color)
         pen.setCapStyle(Qt.PenCapStyle.RoundCap)
-        painter.setPen(pen)
-        painter.drawLine(self._line)
+        for (p1, _), (p2, size) in zip(stroke, stroke[1:]):
+            pen.setWidthF(size)
+            painter.setPen(pen)
+            painter.drawLine(p1, p2)
+
+    def _flush_stroke(self):
+        if len(self._stroke) > 1:
+            self._draw_stroke(self._stroke)
+        self._stroke = self._stroke[-1:]  # last point starts next segment
+
+    def _reset_stroke(self):
+        self._deferred_prompt = None
+        self._flush_timer.stop()
+        self._stroke = []
+
+    def _tile_rects(self, r: QRect):
+        # (key, rect) of every tile under r
+        r = r.intersected(self.rect().toRect())
+        if r.isEmpty():
+            return
+        s = TILE_SIZE
+        bounds = self.rect().toRect()
+        for ty in range(r.top() // s, r.bottom() // s + 1):
+            for tx in range(r.left() // s, r.right() // s + 1):
+                yield (tx, ty), QRect(tx * s, ty * s, s, s).intersected(bounds)
+
+    def _tile(self, key: tuple[int, int], rect: QRect) -> QImage:
+        tile = self._tiles.get(key)
+        if tile is None:
+            tile = QImage(rect.size(), QImage.Format.Format_ARGB32_Premultiplied)
+            tile.fill(Qt.GlobalColor.transparent)
+            self._tiles[key] = tile
+        return tile
+
+    def _read_region(self, r: QRect) -> np.ndarray:
+        pixels = np.zeros((r.height(), r.width()), dtype=np.uint32)
+        for key, tr in self._tile_rects(r):
+            tile = self._tiles.get(key)
+            if tile is None:
+                continue  # never painted, so transparent
+            part = tr.intersected(r)
+            src = tile_pixels(tile)[
+                part.top() - tr.top() : part.bottom() - tr.top() + 1,
+                part.left() - tr.left() : part.right() - tr.left() + 1,
+            ]
+            pixels[
+                part.top() - r.top() : part.bottom() - r.top() + 1,
+                part.left() - r.left() : part.right() - r.left() + 1,
+            ] = src
+        return pixels
+
+    def _write_region(self, r: QRect, pixels: np.ndarray):
+        for key, tr in self._tile_rects(r):
+            part = tr.intersected(r)
+            src = pixels[
+                part.top() - r.top() : part.bottom() - r.top() + 1,
+                part.left() - r.left() : part.right() - r.left() + 1,
+            ]
+            if key not in self._tiles and not src.any():
+                continue
+            dst = tile_pixels(self._tile(key, tr))
+            dst[
+                part.top() - tr.top() : part.bottom() - tr.top() + 1,
+                part.left() - tr.left() : part.right() - tr.left() + 1,
+            ] = src
+            if not dst.any():
+                del self._tiles[key]  # e.g. undo of first stroke over tile
+
+    def _blend(self, r: QRect, image: QImage):
+        # paints image at r over tiles under it, eraser clears where it is opaque
+        for key, tr in self._tile_rects(r):
+            if self._erase_state and key not in self._tiles:
+                continue
+            painter = QPainter(self._tile(key, tr))
+            if self._erase_state:
+                painter.setCompositionMode(
+                    QPainter.CompositionMode.CompositionMode_DestinationOut
+                )
+            painter.drawImage(r.topLeft() - tr.topLeft(), image)
+            painter.end()
+
+    @profiled
+    def _draw_stroke(self, stroke: list[tuple[QPointF, float]]):
+        # stroke is rasterized once around itself, so every tile is blended
+        # once instead of redrawing whole polyline per tile
+        r = self._stroke_rect(stroke).intersected(self.rect().toRect())
+        if r.isEmpty():
+            return
+        self._history.touch(r)
+        mask = QImage(r.size(), QImage.Format.Format_ARGB32_Premultiplied)
+        mask.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(mask)
+        painter.translate(-r.x(), -r.y())
+        color = QColor(0, 0, 0) if self._erase_state else self._brush_color
+        self._paint_stroke(painter, stroke, color)
         painter.end()
-        self.update()
+        self._blend(r, mask)
+        self._dirty = True
+        self.update(QRectF(r))
 
+    @profiled
     def _draw_bundle(self, bundle: np.ndarray):
-        painter = QPainter(self._pixmap)
-        if self._erase_state:
-            painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Clear)
-        pen = QPen(self._brush_color, 1)
-        painter.setPen(pen)
-        for x, y in bundle:
-            painter.drawPoint(x, y)
-        self._bundle_to_draw = None
-        painter.end()
-        self.update()
+        if len(bundle) == 0:
+            return
+        # rasterize whole bundle into one ARGB mask limited to its bounding box
+        x0, y0 = bundle.min(axis=0)
+        x1, y1 = bundle.max(axis=0)
+        w, h = int(x1 - x0 + 1), int(y1 - y0 + 1)
+        r = QRect(int(x0), int(y0), w, h)
+        self._history.touch(r)
+        # erasing clears only opaque mask pixels, same as CompositionMode_Clear
+        value = 0xFF000000 if self._erase_state else self._brush_color.rgba()
+        mask = np.zeros((h, w), dtype=np.uint32)
+        mask[bundle[:, 1] - y0, bundle[:, 0] - x0] = value
+        self._blend(r, QImage(mask.data, w, h, w * 4, QImage.Format.Format_ARGB32))
+        self._dirty = True
+        self.update(QRectF(r))
 
-    def set_image(self, path: str):
-        r = self.parentItem().pixmap().rect()
+    def set_image(self, image: QImage):
+        r = self.parentItem().boundingRect().toRect()
         self.setRect(QRectF(r))
-        self._pixmap.load(path)
+        self._tiles = {}
+        image = image.convertToFormat(QImage.Format.Format_ARGB32_Premultiplied)
+        buffer = image.constBits()
+        buffer.setsize(image.byteCount())
+        pixels = np.frombuffer(buffer, dtype=np.uint32).reshape((image.height(), -1))
+        # fully transparent tiles of loaded label are not allocated
+        self._write_region(
+            r.intersected(image.rect()), pixels[: r.height(), : r.width()]
+        )
+        self._reset_stroke()
+        self._history.reset(r.width(), r.height())
+        self.update()
 
     def clear(self):
-        r = self.parentItem().pixmap().rect()
+        r = self.parentItem().boundingRect().toRect()
         self.setRect(QRectF(r))
-        self._pixmap = QPixmap(r.size())
-        self._pixmap.fill(Qt.GlobalColor.transparent)
+        self._tiles = {}
+        self._reset_stroke()
+        self._history.reset(r.width(), r.height())
+        self._dirty = True
         self.update()  # to make changes be visible instantly
 
+    def _fill_transparent(self):
+        self._tiles = {}
+
+    def erase_all(self):
+        # unlike clear() keeps size and history, so it can be undone,
+        # during a drag it joins the step of that gesture
+        gesture = self._history.is_open()
+        if not gesture:
+            self._history.begin()
+        self._history.touch(self.rect().toRect())
+        self._fill_transparent()
+        if not gesture:
+            self._history.commit()
+        self._dirty = True
+        self.update()
+
+    def undo(self):
+        if self._history.is_open():
+            return  # committing gesture midway would leave its rest out of history
+        r = self._history.undo()
+        if r is not None:
+            self._dirty = True
+            self.update(QRectF(r))
+
+    def redo(self):
+        if self._history.is_open():
+            return
+        r = self._history.redo()
+        if r is not None:
+            self._dirty = True
+            self.update(QRectF(r))
+
+    def is_dirty(self) -> bool:
+        return self._dirty
+
+    def mark_saved(self):
+        self._dirty = False
+
+    @profiled
+    def image(self) -> QImage:
+        # full size image is assembled only for saving
+        r = self.rect().toRect()
+        image = QImage(r.size(), QImage.Format.Format_ARGB32_Premultiplied)
+        image.fill(Qt.GlobalColor.transparent)
+        pixels = tile_pixels(image)
+        for (tx, ty), tile in self._tiles.items():
+            x, y = tx * TILE_SIZE, ty * TILE_SIZE
+            pixels[y : y + tile.height(), x : x + tile.width()] = tile_pixels(tile)
+        return image
+
+    @profiled
     def export_pixmap(self, out_path: Path):
-        self._pixmap.save(str(out_path))
+        self.image().save(str(out_path))
 
     def handle_bundle(self, bundle: np.ndarray):
         if self._sam_mode:
             self._draw_bundle(bundle)
 
+    def handle_prompt_mask(self, session: int, bundle: np.ndarray):
+        # arrives asynchronously, so it is an undo step of its own, drawn
+        # after gesture in progress is over instead of committing it midway
+        if self._history.is_open():
+            self._deferred_prompt = (session, bundle)
+            return
+        replace = (
+            session == self._prompt_session
+            and self._prompt_step is not None
+            and self._history.last_step() is self._prompt_step
+        )
+        if replace:
+            # refined mask replaces previous one unless something was drawn since
+            self.update(QRectF(self._history.undo()))
+        last = self._history.last_step()
+        self._history.begin()
+        self._draw_bundle(bundle)
+        self._history.commit()
+        step = self._history.last_step()
+        self._prompt_session = session
+        self._prompt_step = step if step is not last else None
+
+    @profiled
     def paint(self, painter, option, widget=None):
         super().paint(painter, option, widget)
         painter.save()
-        painter.drawPixmap(QPoint(), self._pixmap)
+        r = option.exposedRect.toAlignedRect()
+        for key, tr in self._tile_rects(r):
+            tile = self._tiles.get(key)
+            if tile is not None:
+                part = tr.intersected(r)
+                painter.drawImage(part.topLeft(), tile, part.translated(-tr.topLeft()))
         painter.restore()
 
     def mousePressEvent(self, event: QGraphicsSceneMouseEvent) -> None:
+        # whole gesture (SAM fill on press + stroke while dragging) is one undo step
+        self._history.begin()
         self._sam_signal.emit(event.pos())
-        self._line.setP1(event.pos())
-        self._line.setP2(event.pos())
+        self._stroke = [(event.pos(), self._stroke_size())]
         super().mousePressEvent(event)
         event.accept()
 
     def mouseMoveEvent(self, event: QGraphicsSceneMouseEvent) -> None:
-        self._line.setP2(event.pos())
-        self._draw_line()
-        self._line.setP1(event.pos())
+        if self._sam_mode and self._prompt_mode:
+            return super().mouseMoveEvent(event)
+        self._stroke.append((event.pos(), self._stroke_size()))
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
         super().mouseMoveEvent(event)
 
+    def mouseReleaseEvent(self, event: QGraphicsSceneMouseEvent) -> None:
+        self._flush_timer.stop()
+        self._flush_stroke()
+        self._stroke = []
+        self._history.commit()
+        if self._deferred_prompt is not None:
+            self.handle_prompt_mask(*self._deferred_prompt)
+            self._deferred_prompt = None
+        super().mouseReleaseEvent(event)
+
     def handle_sam_mode(self, is_sam: bool):
         self._sam_mode = is_sam
+        self._deferred_prompt = None
+
+    def handle_prompt_mode(self, is_prompt: bool):
+        self._prompt_mode = is_prompt
+        self._deferred_prompt = None
@@ -0,0 +1,104 @@
+from pathlib import Path
+from typing import Callable
+import os
+import queue
+import threading
+
+from PyQt5.QtGui import QImage
+
+from .profiler import profiled
+
+RETRY_S = 2.0
+
+
+class LabelWriter:
+    # single background thread, so writes to the same path keep their order
+    def __init__(self, png_compression: int = 6):
+        # fmt: off
+        assert 0 <= png_compression <= 9, f"PNG compression must be in [0, 9], but {png_compression} was given"  # noqa: E501
+        # fmt: on
+        # Qt maps PNG quality [0, 100] to zlib level [9, 0]
+        self._quality = round((9 - png_compression) * 100 / 9)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending: dict[Path, QImage] = {}
+        # called from writer thread with path, image and mtime of written label
+        self.on_written: Callable[[Path, QImage, int], None] | None = None
+        self._thread = threading.Thread(
+            target=self._run, name="label_writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, path: Path, image: QImage):
+        with self._lock:
+            self._pending[path] = image
+        self._queue.put(path)
+
+    def pending(self, path: Path) -> QImage | None:
+        # latest not yet written image for path, if any
+        with self._lock:
+            return self._pending.get(path)
+
+    def _run(self):
+        failed: set[Path] = set()
+        while True:
+            try:
+                # failed writes are retried once queue stays idle for a while
+                path = self._queue.get(timeout=RETRY_S if failed else None)
+            except queue.Empty:
+                failed = {path for path in failed if not self._save(path)}
+                continue
+            if path is None:
+                for path in failed:
+                    if not self._save(path):
+                        print(f"label lost, failed to save: {path}")
+                self._queue.task_done()
+                return
+            if self._save(path):
+                failed.discard(path)
+            elif path not in failed:
+                print(f"failed to save label, will retry: {path}")
+                failed.add(path)
+            self._queue.task_done()
+
+    def _save(self, path: Path) -> bool:
+        # image stays pending until written, so loading sample still shows it
+        with self._lock:
+            image = self._pending.get(path)
+        if image is None:
+            return True
+        mtime = self._write(path, image)
+        if mtime is None:
+            return False
+        if self.on_written is not None:
+            self.on_written(path, image, mtime)
+        with self._lock:
+            # newer image may have been submitted during the write
+            if self._pending.get(path) is image:
+                del self._pending[path]
+        return True
+
+    @profiled
+    def _write(self, path: Path, image: QImage) -> int | None:
+        # mtime of written label, None if it failed, OSError must not end the
+        # thread, since labels queued after it would never be written;
+        # crash during encode never leaves truncated label behind
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        try:
+            if image.save(str(tmp_path), "PNG", self._quality):
+                os.replace(tmp_path, path)
+                return path.stat().st_mtime_ns
+        except OSError:
+            pass
+        try:
+            tmp_path.unlink(missing_ok=True)
+        except OSError:
+            pass
+        return None
+
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
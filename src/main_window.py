@@ -1,9 +1,12 @@
 from pathlib import Path
-import json
+import getpass
+import socket
+import sqlite3
 
-from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot
-from PyQt5.QtGui import QColor, QKeyEvent, QCloseEvent, QIcon, QPixmap
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal, pyqtSlot
+from PyQt5.QtGui import QColor, QFont, QKeyEvent, QCloseEvent, QIcon, QPixmap
 from PyQt5.QtWidgets import (
+    QDockWidget,
     QMainWindow,
     QWidget,
     QGroupBox,
@@ -16,33 +19,116 @@ from PyQt5.QtWidgets import (
     QListWidgetItem,
 )
 
+from .claims import Claims
+from .dataset import id_to_color, load_classes
+from .filmstrip import Filmstrip, FilmstripModel
 from .graphics_view import GraphicsView
+from .label_writer import LabelWriter
+from .packed_dataset import PackedDataset
+from .manifest import DONE, IN_PROGRESS, STATUS_NAMES, UNLABELED, Manifest
+from .profiler import PROFILER
+from .prompt_decoder import PromptDecoder
+from .sample_loader import SampleLoader
+from .thumbnail_cache import ThumbnailCache
 
 
 class MainWindow(QMainWindow):
     brush_feedback = pyqtSignal(int)  # allows QSlider react on mouse wheel
     sam_signal = pyqtSignal(bool)  # used to propagate sam mode to all widgets
-
-    def __init__(self, workdir: str):
+    sample_ready = pyqtSignal(int)  # emitted by loader threads, handled in GUI one
+
+    def __init__(
+        self,
+        workdir: str,
+        cache_budget_mb: int = 1024,
+        prefetch: int = 1,
+        loader_workers: int = 2,
+        png_compression: int = 6,
+        label_mode: str = "rgba",
+        tile_min_megapixels: int = 0,
+        tile_size: int = 512,
+        tile_cache: int = 96,
+        history_mb: int = 256,
+        pen_pressure: bool = False,
+        prompt_decoder: str = "",
+        prompt_threads: int = 2,
+        profile: bool = False,
+        trace_path: str = "trace.json",
+        wand_tolerance: int = 20,
+        claim_batch: int = 0,
+        claim_owner: str = "",
+        claim_ttl_s: float = 600,
+        preview_size: int = 1024,
+        thumbnail_size: int = 96,
+        thumbnail_workers: int = 2,
+    ):
         super(MainWindow, self).__init__()
         self.setWindowTitle("sam_annotator")
         self.resize(1000, 1000)
 
         self._workdir = Path(workdir)
-        self._class_dir = self._workdir / "classes.json"
         self._image_dir = self._workdir / "images"
         self._label_dir = self._workdir / "labels"
         self._sam_dir = self._workdir / "sam"
         self._label_dir.mkdir(exist_ok=True)
-        self._image_stems = [path.stem for path in sorted(self._image_dir.iterdir())]
-        with open(self._class_dir, "r") as f:
-            self._classes = json.loads("".join(f.readlines()))["classes"]
-        ids = [c["id"] for c in self._classes]
+        # packed images/sam/embeddings are used in place of folders when present
+        pack_dir = self._workdir / "pack"
+        self._pack = (
+            PackedDataset(pack_dir) if (pack_dir / "index.json").exists() else None
+        )
+        self._manifest = Manifest(self._workdir, self._pack)
+        self._image_stems = self._manifest.stems
+        # leases keep annotators sharing dataset on different samples
+        self._claim_batch = claim_batch
+        self._claims = None
+        if claim_batch > 0:
+            owner = claim_owner or f"{getpass.getuser()}@{socket.gethostname()}"
+            self._claims = Claims(self._workdir / ".claims", owner, claim_ttl_s)
+            self._stem_ids = {stem: i for i, stem in enumerate(self._image_stems)}
+            self._claim_cursor = -1
+            self._claim_timer = QTimer(self)
+            self._claim_timer.timeout.connect(self.on_claim_timer)
+            self._claim_timer.start(int(claim_ttl_s * 1000 / 3))
+        self._classes = load_classes(self._workdir)
         colors = [c["color"] for c in self._classes]
-        self._id2color = {k: v for k, v in zip(ids, colors)}
+        self._id2color = id_to_color(self._classes)
+        # SAMAT_PROFILE env var enables profiling regardless of config
+        PROFILER.enabled = PROFILER.enabled or profile
+        self._trace_path = Path(trace_path)
+        self._decoder = (
+            PromptDecoder(prompt_decoder, prompt_threads) if prompt_decoder else None
+        )
+        self._label_writer = LabelWriter(png_compression)
+        self._loader = SampleLoader(
+            self._workdir,
+            self._image_stems,
+            cache_budget_mb,
+            prefetch,
+            loader_workers,
+            self._label_writer,
+            tile_min_megapixels,
+            tile_size,
+            tile_cache,
+            self._pack,
+            preview_size,
+        )
+        self._progressive = preview_size > 0
+        self.sample_ready.connect(
+            self.on_sample_ready, Qt.ConnectionType.QueuedConnection
+        )
 
         self.brush_feedback.connect(self.on_brush_size_change)
-        self._graphics_view = GraphicsView(self.brush_feedback)
+        # fmt: off
+        assert label_mode in ("rgba", "class_id"), f"Label mode must be either 'rgba' or 'class_id', but {label_mode} was given"  # noqa: E501
+        # fmt: on
+        class_colors = self._id2color if label_mode == "class_id" else None
+        self._graphics_view = GraphicsView(
+            self.brush_feedback,
+            class_colors=class_colors,
+            history_mb=history_mb,
+            pen_pressure=pen_pressure,
+            decoder=self._decoder,
+        )
         self.sam_signal.connect(self._graphics_view.handle_sam_signal)
 
         # Dataset group
@@ -51,8 +137,12 @@ class MainWindow(QMainWindow):
         self.ds_label = QLabel()
         self.ds_label.setText("Sample: 000000.png")
 
+        self.ds_cache_label = QLabel()
+        self.ds_cache_label.setText("Cache: 0 hits / 0 misses")
+
         ds_vlay = QVBoxLayout(ds_group)
         ds_vlay.addWidget(self.ds_label)
+        ds_vlay.addWidget(self.ds_cache_label)
 
         # Layers group
         ls_group = QGroupBox(self.tr("Layers"))
@@ -92,6 +182,33 @@ class MainWindow(QMainWindow):
         sam_vlay = QVBoxLayout(sam_group)
         sam_vlay.addWidget(self.sam_checkbox)
 
+        self.prompt_checkbox = QCheckBox("Point prompts")
+        self.prompt_checkbox.setEnabled(self._decoder is not None)
+        self.prompt_checkbox.stateChanged.connect(self.on_prompt_change)
+        sam_vlay.addWidget(self.prompt_checkbox)
+
+        self.hover_checkbox = QCheckBox("Hover outline")
+        self.hover_checkbox.setChecked(True)
+        self.hover_checkbox.stateChanged.connect(self.on_hover_change)
+        sam_vlay.addWidget(self.hover_checkbox)
+
+        self.wand_checkbox = QCheckBox("Color wand")
+        self.wand_checkbox.stateChanged.connect(self.on_wand_change)
+        sam_vlay.addWidget(self.wand_checkbox)
+
+        self.wand_value = QLabel()
+        self.wand_value.setText(f"Wand tolerance: {wand_tolerance}")
+
+        self.wand_slider = QSlider()
+        self.wand_slider.setOrientation(Qt.Orientation.Horizontal)
+        self.wand_slider.setMinimum(0)
+        self.wand_slider.setMaximum(128)
+        self.wand_slider.setSliderPosition(wand_tolerance)
+        self.wand_slider.valueChanged.connect(self.on_wand_slider_change)
+        self._graphics_view.set_wand_tolerance(wand_tolerance)
+        sam_vlay.addWidget(self.wand_value)
+        sam_vlay.addWidget(self.wand_slider)
+
         # Brush size group
         bs_group = QGroupBox(self.tr("Brush"))
 
@@ -131,6 +248,20 @@ class MainWindow(QMainWindow):
         vlay.addWidget(ls_group)
         vlay.addWidget(bs_group)
         vlay.addWidget(cs_group)
+        if PROFILER.enabled:
+            # Latency group, exists only while profiling
+            pf_group = QGroupBox(self.tr("Latency p50 / p99"))
+
+            self.pf_label = QLabel()
+            self.pf_label.setFont(QFont("monospace", 8))
+
+            pf_vlay = QVBoxLayout(pf_group)
+            pf_vlay.addWidget(self.pf_label)
+            vlay.addWidget(pf_group)
+
+            self._pf_timer = QTimer(self)
+            self._pf_timer.timeout.connect(self.on_pf_timer)
+            self._pf_timer.start(1000)
         vlay.addStretch()
 
         central_widget = QWidget()
@@ -140,10 +271,63 @@ class MainWindow(QMainWindow):
         lay.addWidget(self._graphics_view, stretch=1)
         lay.addLayout(vlay, stretch=0)
 
+        # Filmstrip dock, one click jumps to any sample
+        self._thumbnails = None
+        self._filmstrip = None
+        if thumbnail_size > 0:
+            self._thumbnails = ThumbnailCache(
+                self._workdir,
+                self._image_stems,
+                thumbnail_size,
+                thumbnail_workers,
+                pack=self._pack,
+            )
+            self._filmstrip_model = FilmstripModel(
+                self._image_stems, self._manifest.statuses(), self._thumbnails
+            )
+            self._filmstrip = Filmstrip(self._filmstrip_model, thumbnail_size)
+            self._filmstrip.sample_clicked.connect(self.on_filmstrip_clicked)
+            self._filmstrip_dock = QDockWidget(self.tr("Samples"), self)
+            self._filmstrip_dock.setObjectName("filmstrip")
+            self._filmstrip_dock.setWidget(self._filmstrip)
+            self._filmstrip_dock.setAllowedAreas(
+                Qt.DockWidgetArea.TopDockWidgetArea
+                | Qt.DockWidgetArea.BottomDockWidgetArea
+            )
+            self.addDockWidget(
+                Qt.DockWidgetArea.BottomDockWidgetArea, self._filmstrip_dock
+            )
+
         self._curr_id = 0
         self._graphics_view.set_brush_color(QColor(colors[0]))
         self.cs_list.setCurrentRow(0)
 
+    @pyqtSlot()
+    def on_pf_timer(self):
+        lines = [
+            f"{name.replace('Layer', '')}: {p50:.1f} / {p99:.1f} ms"
+            for name, (p50, p99, _) in PROFILER.summary().items()
+        ]
+        self.pf_label.setText("\n".join(lines))
+
+    @pyqtSlot()
+    def on_claim_timer(self):
+        lost = self._claims.renew()
+        if lost:
+            print(f"claims taken over by other annotators: {', '.join(lost)}")
+        self._claim_more()
+        self._update_ds_label()
+
+    @pyqtSlot(int)
+    def on_sample_ready(self, id: int):
+        # swaps preview for full resolution sample
+        if id == self._curr_id and self._graphics_view.is_preview():
+            self._graphics_view.load_sample(self._loader.get(id))
+
+    @pyqtSlot(int)
+    def on_filmstrip_clicked(self, id: int):
+        self._switch_sample_by(id - self._curr_id)
+
     @pyqtSlot(int)
     def on_sam_change(self, state: int):
         if state == Qt.CheckState.Checked:
@@ -153,6 +337,27 @@ class MainWindow(QMainWindow):
         else:
             print("unsupported check state")
 
+    @pyqtSlot(int)
+    def on_prompt_change(self, state: int):
+        if state == Qt.CheckState.Checked:
+            self.wand_checkbox.setChecked(False)
+        self._graphics_view.set_prompt_mode(state == Qt.CheckState.Checked)
+
+    @pyqtSlot(int)
+    def on_hover_change(self, state: int):
+        self._graphics_view.set_hover_mode(state == Qt.CheckState.Checked)
+
+    @pyqtSlot(int)
+    def on_wand_change(self, state: int):
+        if state == Qt.CheckState.Checked:
+            self.prompt_checkbox.setChecked(False)
+        self._graphics_view.set_wand_mode(state == Qt.CheckState.Checked)
+
+    @pyqtSlot(int)
+    def on_wand_slider_change(self, value: int):
+        self.wand_value.setText(f"Wand tolerance: {value}")
+        self._graphics_view.set_wand_tolerance(value)
+
     @pyqtSlot(int)
     def on_ls_label_slider_change(self, value: int):
         self.ls_label_value.setText(f"Label opacity: {value}%")
@@ -180,25 +385,127 @@ class MainWindow(QMainWindow):
         self._graphics_view.set_brush_color(QColor(color))
 
     def save_current_label(self):
-        curr_label_path = self._label_dir / f"{self._image_stems[self._curr_id]}.png"
-        self._graphics_view.save_label_to(curr_label_path)
+        if self._graphics_view.is_preview():
+            return  # label of previous sample is still in label layer
+        # viewing sample writes nothing and keeps its status
+        if not self._graphics_view.is_label_dirty():
+            return
+        stem = self._image_stems[self._curr_id]
+        curr_label_path = self._label_dir / f"{stem}.png"
+        # edited sample is claimed, so it is never overwritten by other annotator,
+        # samples only looked at stay free for others
+        if self._claims is not None and not self._claims.claim(stem):
+            holder = self._claims.holder(stem)
+            print(f"label of {stem} not saved, sample is claimed by {holder}")
+            return
+        image = self._graphics_view.label_image()
+        self._label_writer.submit(curr_label_path, image)
+        self._graphics_view.mark_label_saved()
+        self._loader.update_label(stem, image)
+        if self._manifest.status(self._curr_id) == UNLABELED:
+            self._set_status(self._curr_id, IN_PROGRESS)
+
+    def _set_status(self, id: int, status: int):
+        try:
+            self._manifest.set_status(id, status)
+        except sqlite3.OperationalError as e:
+            print(f"status of {self._image_stems[id]} not saved: {e}")
+            return
+        if self._filmstrip is not None:
+            self._filmstrip_model.set_status(id, status)
 
     def _load_sample_by_id(self, id: int):
         self._curr_id = id
+        sample, preview = None, None
+        if self._progressive:
+            sample = self._loader.fetch(id, lambda: self.sample_ready.emit(id))
+            if sample is None:
+                preview = self._loader.preview(id)
+        if preview is not None:
+            self._graphics_view.load_preview(preview)
+        else:
+            self._graphics_view.load_sample(sample or self._loader.get(id))
+        if self._claims is None:
+            # shared by annotators otherwise, who start at their claimed samples
+            self._manifest.last_idx = id
+        if self._filmstrip is not None:
+            self._filmstrip.set_current(id)
+        self._update_ds_label()
+        stats = self._loader.stats
+        self.ds_cache_label.setText(
+            f"Cache: {stats['hits']} hits / {stats['misses']} misses"
+        )
+
+    def _update_ds_label(self):
         name = f"{self._image_stems[self._curr_id]}.png"
-        image_path = self._image_dir / name
-        label_path = self._label_dir / name
-        sam_path = self._sam_dir / name
-        self._graphics_view.load_sample(image_path, label_path, sam_path)
-        self.ds_label.setText(f"Sample: {name}")
+        status = STATUS_NAMES[self._manifest.status(self._curr_id)]
+        if self._claims is not None:
+            holder = self._claims.holder(self._image_stems[self._curr_id])
+            if holder is not None:
+                status = f"{status}, claimed by {holder}"
+        self.ds_label.setText(f"Sample: {name} ({status})")
+
+    def _claim_more(self):
+        # tops up held leases to batch size with next free unlabeled samples,
+        # scan continues from last claimed one, so stems held by others are
+        # checked once instead of on every top-up
+        wrapped = False
+        while len(self._claims.held) < self._claim_batch:
+            idx = self._manifest.next_with_status(UNLABELED, self._claim_cursor)
+            if idx is None:
+                if wrapped or self._claim_cursor < 0:
+                    return
+                wrapped = True
+                self._claim_cursor = -1
+                continue
+            self._claim_cursor = idx
+            self._claims.claim(self._image_stems[idx])
+
+    def _next_claimed(self, after: int) -> int | None:
+        # next held sample, wraps around
+        ids = sorted(self._stem_ids[stem] for stem in self._claims.held)
+        later = [idx for idx in ids if idx > after]
+        return (later or ids or [None])[0]
 
     def load_latest_sample(self):
-        labels = list(self._label_dir.iterdir())
-        images = list(self._image_dir.iterdir())
-        if len(labels) < len(images):
-            self._load_sample_by_id(len(labels))
-        else:
-            self._load_sample_by_id(0)
+        # resumes at last visited sample, falls back to first unlabeled one
+        idx = self._manifest.last_idx
+        if self._claims is not None:
+            # last visited sample is shared by annotators, so start at claimed one
+            self._claim_more()
+            claimed = self._next_claimed(-1)
+            idx = idx if claimed is None else claimed
+        if idx is None or idx >= len(self._image_stems):
+            idx = self._manifest.next_with_status(UNLABELED)
+        self._load_sample_by_id(idx if idx is not None else 0)
+
+    def _toggle_done(self):
+        self.save_current_label()
+        stem = self._image_stems[self._curr_id]
+        if self._claims is not None and not self._claims.claim(stem):
+            return  # status is changed only by annotator holding sample
+        status = self._manifest.status(self._curr_id)
+        new_status = IN_PROGRESS if status == DONE else DONE
+        self._set_status(self._curr_id, new_status)
+        if self._claims is not None and new_status == DONE:
+            # finished sample frees its lease for next unlabeled one
+            self._claims.release(stem)
+            self._claim_more()
+        self._update_ds_label()
+
+    def _jump_to_unlabeled(self):
+        if self._claims is not None:
+            self._claim_more()
+            idx = self._next_claimed(self._curr_id)
+            if idx is not None and idx != self._curr_id:
+                self._switch_sample_by(idx - self._curr_id)
+            return
+        idx = self._manifest.next_with_status(UNLABELED, self._curr_id)
+        if idx is None:
+            idx = self._manifest.next_with_status(UNLABELED)  # wraps around
+        if idx is None or idx == self._curr_id:
+            return
+        self._switch_sample_by(idx - self._curr_id)
 
     def _switch_sample_by(self, step: int):
         if step == 0:
@@ -211,10 +518,28 @@ class MainWindow(QMainWindow):
         self._load_sample_by_id(new_id)
 
     def keyPressEvent(self, a0: QKeyEvent) -> None:
-        if a0.key() == Qt.Key.Key_Space:
+        ctrl = a0.modifiers() & Qt.KeyboardModifier.ControlModifier
+        shift = a0.modifiers() & Qt.KeyboardModifier.ShiftModifier
+        if ctrl and a0.key() == Qt.Key.Key_Z:
+            if shift:
+                self._graphics_view.redo()
+            else:
+                self._graphics_view.undo()
+        elif ctrl and a0.key() == Qt.Key.Key_Y:
+            self._graphics_view.redo()
+        elif a0.key() == Qt.Key.Key_Space:
             self._graphics_view.reset_zoom()
         elif a0.key() == Qt.Key.Key_S:
             self.sam_checkbox.toggle()
+        elif a0.key() == Qt.Key.Key_P:
+            if self.prompt_checkbox.isEnabled():
+                self.prompt_checkbox.toggle()
+        elif a0.key() == Qt.Key.Key_H:
+            self.hover_checkbox.toggle()
+        elif a0.key() == Qt.Key.Key_W:
+            self.wand_checkbox.toggle()
+        elif a0.key() == Qt.Key.Key_Escape:
+            self._graphics_view.reset_prompt()
         elif a0.key() == Qt.Key.Key_C:
             self._graphics_view.clear_label()
         elif a0.key() == Qt.Key.Key_E:
@@ -230,9 +555,29 @@ class MainWindow(QMainWindow):
             self._switch_sample_by(-1)
         elif a0.key() == Qt.Key.Key_Period:
             self._switch_sample_by(1)
+        elif a0.key() == Qt.Key.Key_D:
+            self._toggle_done()
+        elif a0.key() == Qt.Key.Key_N:
+            self._jump_to_unlabeled()
+        elif a0.key() == Qt.Key.Key_F:
+            if self._filmstrip is not None:
+                self._filmstrip_dock.setVisible(not self._filmstrip_dock.isVisible())
 
         return super().keyPressEvent(a0)
 
     def closeEvent(self, a0: QCloseEvent) -> None:
         self.save_current_label()
+        self.sample_ready.disconnect()  # queued decodes of closed window are dropped
+        self._loader.shutdown()
+        if self._thumbnails is not None:
+            self._thumbnails.shutdown()
+        self._label_writer.close()  # flushes queued labels
+        if self._claims is not None:
+            self._claims.release_all()
+        if self._decoder is not None:
+            self._decoder.shutdown()
+        self._manifest.close()
+        if PROFILER.enabled:
+            PROFILER.dump_trace(self._trace_path)
+            print(f"trace saved to {self._trace_path}")
         return super().closeEvent(a0)
@@ -0,0 +1,145 @@
+from pathlib import Path
+import os
+import sqlite3
+import time
+
+from .packed_dataset import PackedDataset
+
+UNLABELED = 0
+IN_PROGRESS = 1
+DONE = 2
+STATUS_NAMES = {UNLABELED: "unlabeled", IN_PROGRESS: "in progress", DONE: "done"}
+WRITE_RETRIES = 5
+
+
+class Manifest:
+    # sqlite index of dataset samples, images folder is rescanned only when it changes
+    def __init__(self, workdir: Path, pack: PackedDataset | None = None):
+        self._image_dir = workdir / "images"
+        self._pack = pack
+        self._label_dir = workdir / "labels"
+        self._db = sqlite3.connect(workdir / ".manifest.sqlite")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS samples (
+                idx INTEGER PRIMARY KEY,
+                stem TEXT UNIQUE NOT NULL,
+                status INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS samples_status ON samples (status, idx);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+            """)
+        # directory mtime changes when files are added, removed or renamed
+        source = self._image_dir if pack is None else pack.index_path
+        dir_mtime = source.stat().st_mtime_ns
+        if self._meta("images_mtime_ns") != dir_mtime:
+            self._rescan()
+            self._set_meta("images_mtime_ns", dir_mtime)
+        rows = self._db.execute("SELECT stem FROM samples ORDER BY idx")
+        self.stems = [stem for (stem,) in rows]
+
+    def _meta(self, key: str) -> int | None:
+        row = self._db.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _set_meta(self, key: str, value: int):
+        self._write(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    def _write(self, sql: str, params: tuple):
+        # manifest shared by annotators may stay locked by another writer
+        # longer than sqlite busy timeout, e.g. on slow network filesystem
+        for attempt in range(WRITE_RETRIES):
+            try:
+                with self._db:
+                    self._db.execute(sql, params)
+                return
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or attempt == WRITE_RETRIES - 1:
+                    raise
+            time.sleep(0.1 * 2**attempt)
+
+    def _rescan(self):
+        # listing is diffed against stored rows, so only added, removed and moved
+        # samples are written and statuses of known stems are kept
+        stored = {
+            stem: (idx, size, mtime_ns)
+            for idx, stem, size, mtime_ns in self._db.execute(
+                "SELECT idx, stem, size, mtime_ns FROM samples"
+            )
+        }
+        if self._pack is None:
+            entries = sorted(os.scandir(self._image_dir), key=lambda e: e.name)
+            files = [(e.name, e.stat().st_size, e.stat().st_mtime_ns) for e in entries]
+        else:
+            # packed files have no mtime of their own, pack is rebuilt as a whole
+            files = [
+                (f"{stem}.png", self._pack.size(f"images/{stem}.png"), 0)
+                for stem in self._pack.image_stems()
+            ]
+        listed = set()
+        added, moved = [], []
+        for idx, (name, size, mtime_ns) in enumerate(files):
+            stem = Path(name).stem
+            listed.add(stem)
+            row = stored.get(stem)
+            if row is None:
+                added.append((idx, stem, size, mtime_ns))
+            elif row != (idx, size, mtime_ns):
+                moved.append((idx, size, mtime_ns, stem))
+        removed = [(stem,) for stem in stored.keys() - listed]
+        if not (added or moved or removed):
+            return
+        # new stems with label file start in progress
+        labeled = set(os.listdir(self._label_dir)) if added else set()
+        rows = [
+            (idx, stem, IN_PROGRESS if f"{stem}.png" in labeled else UNLABELED, *rest)
+            for idx, stem, *rest in added
+        ]
+        with self._db:
+            self._db.executemany("DELETE FROM samples WHERE stem = ?", removed)
+            # moved rows pass through negative idx, so they never collide
+            # with each other while renumbered
+            self._db.executemany(
+                "UPDATE samples SET idx = -1 - ?, size = ?, mtime_ns = ? WHERE stem = ?",
+                moved,
+            )
+            self._db.execute("UPDATE samples SET idx = -1 - idx WHERE idx < 0")
+            self._db.executemany("INSERT INTO samples VALUES (?, ?, ?, ?, ?)", rows)
+
+    def status(self, idx: int) -> int:
+        row = self._db.execute(
+            "SELECT status FROM samples WHERE idx = ?", (idx,)
+        ).fetchone()
+        return row[0]
+
+    def statuses(self) -> list[int]:
+        # status of every sample in one query
+        rows = self._db.execute("SELECT status FROM samples ORDER BY idx")
+        return [status for (status,) in rows]
+
+    def set_status(self, idx: int, status: int):
+        self._write("UPDATE samples SET status = ? WHERE idx = ?", (status, idx))
+
+    def next_with_status(self, status: int, after: int = -1) -> int | None:
+        # uses (status, idx) index, so it does not scan the dataset
+        row = self._db.execute(
+            "SELECT idx FROM samples WHERE status = ? AND idx > ? ORDER BY idx LIMIT 1",
+            (status, after),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    @property
+    def last_idx(self) -> int | None:
+        return self._meta("last_idx")
+
+    @last_idx.setter
+    def last_idx(self, idx: int):
+        self._set_meta("last_idx", idx)
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,135 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+import io
+import json
+import mmap
+import os
+
+import numpy as np
+
+PACKED_FOLDERS = ("images", "sam", "embeddings")
+
+
+class PackedDataset:
+    # read-only files of dataset folders appended into few large memory-mapped chunks
+    def __init__(self, pack_dir: Path):
+        self.index_path = pack_dir / "index.json"
+        with open(self.index_path, "r") as f:
+            index = json.load(f)
+        self._chunk_paths = [pack_dir / name for name in index["chunks"]]
+        # relative path -> (chunk, offset, size)
+        self._entries: dict[str, list[int]] = index["entries"]
+        self._maps: list[mmap.mmap | None] = [None] * len(self._chunk_paths)
+
+    def _map(self, chunk: int) -> mmap.mmap:
+        m = self._maps[chunk]
+        if m is None:
+            with open(self._chunk_paths[chunk], "rb") as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[chunk] = m
+        return m
+
+    def exists(self, rel_path: str) -> bool:
+        return rel_path in self._entries
+
+    def size(self, rel_path: str) -> int:
+        return self._entries[rel_path][2]
+
+    def read(self, rel_path: str) -> memoryview:
+        chunk, offset, size = self._entries[rel_path]
+        return memoryview(self._map(chunk))[offset : offset + size]
+
+    def load_npy(self, rel_path: str) -> np.ndarray:
+        # zero-copy view into chunk, like np.load(mmap_mode="r") on a plain file
+        chunk, offset, _ = self._entries[rel_path]
+        header = io.BytesIO(self.read(rel_path)[:4096])
+        if np.lib.format.read_magic(header) == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(header)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(header)
+        return np.ndarray(
+            shape,
+            dtype,
+            self._map(chunk),
+            offset + header.tell(),
+            order="F" if fortran else "C",
+        )
+
+    def image_stems(self) -> list[str]:
+        names = [p[len("images/") :] for p in self._entries if p.startswith("images/")]
+        return [Path(name).stem for name in sorted(names)]
+
+    @staticmethod
+    def pack(
+        workdir: Path,
+        pack_dir: Path,
+        workers: int = 8,
+        chunk_bytes: int = 4 << 30,
+        align: int = 64,
+    ):
+        # files are read by a thread pool (latency bound on network storage)
+        # and appended in order by this thread, so output is deterministic
+        pack_dir.mkdir(parents=True, exist_ok=True)
+        rel_paths = [
+            f"{folder}/{entry.name}"
+            for folder in PACKED_FOLDERS
+            if (workdir / folder).is_dir()
+            for entry in sorted(os.scandir(workdir / folder), key=lambda e: e.name)
+            if entry.is_file() and not entry.name.startswith(".")
+        ]
+        chunks: list[str] = []
+        entries: dict[str, list[int]] = {}
+        out = None
+        offset = 0
+
+        def read(rel_path: str) -> bytes:
+            with open(workdir / rel_path, "rb") as f:
+                return f.read()
+
+        def append(rel_path: str, data: bytes):
+            nonlocal out, offset
+            if out is None or offset + len(data) > chunk_bytes and offset > 0:
+                if out is not None:
+                    out.close()
+                chunks.append(f"chunk_{len(chunks):03d}.bin")
+                out = open(pack_dir / chunks[-1], "wb")
+                offset = 0
+            # aligned offsets keep memory-mapped arrays aligned
+            pad = -offset % align
+            out.write(b"\0" * pad)
+            offset += pad
+            out.write(data)
+            entries[rel_path] = [len(chunks) - 1, offset, len(data)]
+            offset += len(data)
+
+        # bounded read-ahead, so memory does not grow with dataset size
+        pending: deque[tuple[str, Future]] = deque()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for rel_path in rel_paths:
+                pending.append((rel_path, pool.submit(read, rel_path)))
+                if len(pending) > workers * 4:
+                    done_path, future = pending.popleft()
+                    append(done_path, future.result())
+            while pending:
+                done_path, future = pending.popleft()
+                append(done_path, future.result())
+        if out is not None:
+            out.close()
+        # index is written last, so interrupted pack is never opened
+        tmp_path = pack_dir / ".index.json.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": 1, "chunks": chunks, "entries": entries}, f)
+        os.replace(tmp_path, pack_dir / "index.json")
+
+    def unpack(self, out_dir: Path, workers: int = 8):
+        for folder in {p.split("/")[0] for p in self._entries}:
+            (out_dir / folder).mkdir(parents=True, exist_ok=True)
+
+        def write(rel_path: str):
+            with open(out_dir / rel_path, "wb") as f:
+                f.write(self.read(rel_path))
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for _ in pool.map(write, self._entries):
+                pass
@@ -0,0 +1,73 @@
+from collections import deque
+from collections.abc import Callable
+from functools import wraps
+from pathlib import Path
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+
+class Profiler:
+    # rolling latency windows per hot path and chrome trace events, off by default
+    def __init__(self, window: int = 1000, max_events: int = 200_000):
+        self.enabled = os.environ.get("SAMAT_PROFILE", "") not in ("", "0")
+        self._window = window
+        self._durations: dict[str, deque[float]] = {}
+        self._events: deque[tuple] = deque(maxlen=max_events)
+        self._t0 = time.perf_counter_ns()
+
+    def record(self, name: str, start_ns: int, end_ns: int):
+        durations = self._durations.get(name)
+        if durations is None:
+            durations = self._durations.setdefault(name, deque(maxlen=self._window))
+        durations.append((end_ns - start_ns) / 1e6)
+        self._events.append((name, start_ns, end_ns, threading.get_ident()))
+
+    def summary(self) -> dict[str, tuple[float, float, int]]:
+        # name -> (p50 ms, p99 ms, samples in window)
+        result = {}
+        for name, durations in sorted(self._durations.items()):
+            values = np.fromiter(durations, dtype=np.float64)
+            if len(values) > 0:
+                p50, p99 = np.percentile(values, [50, 99])
+                result[name] = (float(p50), float(p99), len(values))
+        return result
+
+    def dump_trace(self, path: Path):
+        # Trace Event Format, opens in chrome://tracing and Perfetto
+        events = [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": (start - self._t0) / 1000,
+                "dur": (end - start) / 1000,
+                "pid": os.getpid(),
+                "tid": tid,
+            }
+            for name, start, end, tid in list(self._events)
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+PROFILER = Profiler()
+
+
+def profiled(fn: Callable) -> Callable:
+    # disabled cost is one attribute check per call
+    name = fn.__qualname__
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not PROFILER.enabled:
+            return fn(*args, **kwargs)
+        start = time.perf_counter_ns()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            PROFILER.record(name, start, time.perf_counter_ns())
+
+    return wrapper
@@ -0,0 +1,78 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import itertools
+
+from PyQt5.QtCore import QObject, pyqtSignal
+import numpy as np
+
+try:
+    import onnxruntime
+except ImportError:  # optional, needed only for point prompts
+    onnxruntime = None
+
+
+class PromptDecoder(QObject):
+    # runs SAM prompt decoder exported to ONNX on cached image embeddings
+    mask_ready = pyqtSignal(int, np.ndarray)  # prompt session, (N, 2) x, y pixels
+
+    def __init__(self, model_path: str, threads: int = 2):
+        super().__init__()
+        # fmt: off
+        assert onnxruntime is not None, "Point prompts require onnxruntime, install it via 'pip install onnxruntime'"  # noqa: E501
+        # fmt: on
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        self._session = onnxruntime.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        # single worker keeps requests ordered, stale ones are skipped
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prompt")
+        self._requests = itertools.count(1)
+        self._latest = 0
+
+    def submit(
+        self,
+        session: int,
+        embedding: np.ndarray,
+        points: list[tuple[float, float]],
+        labels: list[int],
+        size: tuple[int, int],
+    ):
+        request = next(self._requests)
+        self._latest = request
+        future = self._pool.submit(
+            self._run, request, session, embedding, points, labels, size
+        )
+        future.add_done_callback(self._report)
+
+    def _report(self, future: Future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"prompt decoder failed: {future.exception()}")
+
+    def _run(self, request, session, embedding, points, labels, size):
+        if request != self._latest:
+            return  # newer click arrived while waiting, its result supersedes this
+        h, w = size
+        # same resize to 1024 longest side as SAM image encoder input
+        scale = 1024 / max(h, w)
+        new_w, new_h = int(w * scale + 0.5), int(h * scale + 0.5)
+        coords = np.array(points + [(0.0, 0.0)], dtype=np.float32)
+        coords *= np.array([new_w / w, new_h / h], dtype=np.float32)
+        # padding point with label -1 stands for absent box prompt
+        point_labels = np.array(labels + [-1], dtype=np.float32)
+        masks = self._session.run(
+            ["masks"],
+            {
+                "image_embeddings": np.ascontiguousarray(embedding, dtype=np.float32),
+                "point_coords": coords[None],
+                "point_labels": point_labels[None],
+                "mask_input": np.zeros((1, 1, 256, 256), dtype=np.float32),
+                "has_mask_input": np.zeros(1, dtype=np.float32),
+                "orig_im_size": np.array([h, w], dtype=np.float32),
+            },
+        )[0]
+        ys, xs = np.nonzero(masks[0, 0] > 0.0)
+        # queued to GUI thread, since decoder lives there
+        self.mask_ready.emit(session, np.column_stack((xs, ys)))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
@@ -1,61 +1,167 @@
-from PyQt5.QtCore import Qt, QPoint, QRectF, QPointF
-from PyQt5.QtWidgets import QGraphicsRectItem
-from PyQt5.QtGui import QPixmap, QPen
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, QRectF, QPointF
+from PyQt5.QtWidgets import QApplication, QGraphicsItem, QGraphicsRectItem
+from PyQt5.QtGui import QImage, QPainterPath, QPen, QPolygonF
 import numpy as np
 
+from .components import boundary_loops
+from .flood_fill import flood_fill
+from .profiler import profiled
+from .prompt_decoder import PromptDecoder
+from .segment_index import SEGMENT_COLORS, SegmentIndex, display_ids
+
 
 class SamLayer(QGraphicsRectItem):
-    def __init__(self, parent, label_signal):
+    def __init__(
+        self,
+        parent,
+        label_signal,
+        decoder: PromptDecoder | None = None,
+        max_outlines: int = 256,
+    ):
         super().__init__(parent)
         self.setOpacity(0.0)
         self.setPen(QPen(Qt.PenStyle.NoPen))
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
 
         self._label_signal = label_signal
-        self._pixmap = QPixmap()
         self._sam_mode = False
-        self._img = None  # QImage to fetch color from
-        self._np_img = None  # np array for fast pixels fetch
+        self._index = None  # per-segment pixel index built once per sample
+        # overlay is Indexed8 view of uint8 ids, click lookups read the same buffer
+        self._ids = None
+        self._view = QImage()
+        # hover outlines of recently visited segments, built on first hover
+        self._outlines: OrderedDict[int, QPainterPath] = OrderedDict()
+        self._max_outlines = max_outlines
+        self._decoder = decoder
+        self._embedding = None
+        self._prompt_mode = False
+        self._prompt_session = 0  # bumped whenever prompt points start over
+        self._points: list[tuple[float, float]] = []
+        self._point_labels: list[int] = []
+        self._wand_mode = False  # clicks fill similar colors of image, no mask needed
+        self._wand_tolerance = 20
 
-    def set_image(self, path: str):
-        r = self.parentItem().pixmap().rect()
+    def set_index(self, index: SegmentIndex):
+        r = self.parentItem().boundingRect().toRect()
         self.setRect(QRectF(r))
-        self._pixmap.load(path)
-        self._update_img()
-
-    def _update_img(self):
-        image = self._pixmap.toImage()
-        buffer = image.bits()
-        buffer.setsize(image.byteCount())
-        np_img = np.frombuffer(buffer, dtype=np.uint8)
-        np_img = np_img.reshape((image.height(), image.width(), 4))
-        self._img = image
-        self._np_img = np_img
+        self._index = index
+        self._ids = display_ids(index.ids)
+        h, w = self._ids.shape
+        self._view = QImage(
+            self._ids.ctypes.data,
+            w,
+            h,
+            self._ids.strides[0],
+            QImage.Format.Format_Indexed8,
+        )
+        self._view.setColorTable(SEGMENT_COLORS)
+        self._outlines.clear()
+        self.update()
 
     def clear(self):
-        r = self.parentItem().pixmap().rect()
+        r = self.parentItem().boundingRect().toRect()
         self.setRect(QRectF(r))
-        self._pixmap = QPixmap(r.size())
-        self._pixmap.fill(Qt.GlobalColor.transparent)
+        self._index = None
+        self._ids = None
+        self._view = QImage()
+        self._outlines.clear()
         self.update()  # to make changes be visible instantly
 
+    def set_embedding(self, embedding: np.ndarray | None):
+        self._embedding = embedding
+        self.reset_prompt()
+
+    def reset_prompt(self):
+        self._prompt_session += 1
+        self._points = []
+        self._point_labels = []
+
+    def is_current_prompt(self, session: int) -> bool:
+        # False for masks of clicks made before sample switch or mode change
+        return self._sam_mode and self._prompt_mode and session == self._prompt_session
+
+    def _prompt(self, pos: QPointF):
+        # Shift+click adds negative point, result replaces mask of previous click
+        shift = QApplication.keyboardModifiers() & Qt.KeyboardModifier.ShiftModifier
+        self._points.append((pos.x(), pos.y()))
+        self._point_labels.append(0 if shift else 1)
+        size = (int(self.rect().height()), int(self.rect().width()))
+        self._decoder.submit(
+            self._prompt_session,
+            self._embedding,
+            list(self._points),
+            list(self._point_labels),
+            size,
+        )
+
+    @profiled
     def paint(self, painter, option, widget=None):
         super().paint(painter, option, widget)
         painter.save()
-        painter.drawPixmap(QPoint(), self._pixmap)
+        # only exposed part of palette view gets converted to screen format
+        r = option.exposedRect.toAlignedRect().intersected(self._view.rect())
+        painter.drawImage(r.topLeft(), self._view, r)
         painter.restore()
 
+    def hover_segment(self, pos: QPointF) -> int:
+        # segment that click at pos would fill, 0 if click would not use SAM masks
+        if not self._sam_mode or self._wand_mode or self._index is None:
+            return 0
+        if self._prompt_mode and self._decoder and self._embedding is not None:
+            return 0
+        return self._index.segment_at(int(pos.x()), int(pos.y()))
+
+    @profiled
+    def outline(self, seg_id: int) -> QPainterPath:
+        path = self._outlines.get(seg_id)
+        if path is not None:
+            self._outlines.move_to_end(seg_id)
+            return path
+        # only bbox of segment is scanned, bboxes come precomputed with .npz masks
+        x0, y0, x1, y1 = (int(v) for v in self._index.bboxes[seg_id])
+        mask = self._index.ids[y0 : y1 + 1, x0 : x1 + 1] == seg_id
+        path = QPainterPath()
+        for loop in boundary_loops(mask):
+            path.addPolygon(QPolygonF([QPointF(x + x0, y + y0) for x, y in loop]))
+            path.closeSubpath()
+        self._outlines[seg_id] = path
+        while len(self._outlines) > self._max_outlines:
+            self._outlines.popitem(last=False)
+        return path
+
+    @profiled
     def handle_click(self, pos: QPointF):
-        if not self._sam_mode or not self._img:
+        if not self._sam_mode:
+            return
+        if self._prompt_mode and self._decoder and self._embedding is not None:
+            self._prompt(pos)
+            return
+        if self._wand_mode:
+            pixels = self.parentItem().pixels()
+            if pixels is not None:
+                x, y = int(pos.x()), int(pos.y())
+                self._label_signal.emit(flood_fill(pixels, x, y, self._wand_tolerance))
+            return
+        if self._index is None:
             return
-        x = int(pos.x())
-        y = int(pos.y())
-        pc = self._img.pixelColor(x, y)
-        print(f"pixel_color: ({pc.red()}, {pc.green()}, {pc.blue()})")
-        if pc.red() == pc.green() == pc.blue() == 0:
+        seg_id = self._index.segment_at(int(pos.x()), int(pos.y()))
+        if seg_id == 0:
             return
-        ids = np.where((self._np_img[:, :, :3] == pc.getRgb()[:3]).all(axis=2))
-        pixels = np.column_stack((ids[1], ids[0]))
+        pixels = self._index.pixels(seg_id)
         self._label_signal.emit(pixels)
 
     def handle_sam_mode(self, is_sam: bool):
         self._sam_mode = is_sam
+        self.reset_prompt()
+
+    def handle_prompt_mode(self, is_prompt: bool):
+        self._prompt_mode = is_prompt
+        self.reset_prompt()
+
+    def handle_wand_mode(self, is_wand: bool):
+        self._wand_mode = is_wand
+
+    def set_wand_tolerance(self, value: int):
+        self._wand_tolerance = value
@@ -0,0 +1,375 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+import io
+import os
+import threading
+
+from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtGui import QImage, QImageReader
+import numpy as np
+
+from .label_writer import LabelWriter
+from .packed_dataset import PackedDataset
+from .segment_index import SegmentIndex, ids_from_image
+from .tile_pyramid import TilePyramid
+
+
+@dataclass
+class Sample:
+    stem: str
+    image: QImage | None  # None for tiled samples
+    label: QImage | None = None
+    sam_index: SegmentIndex | None = None
+    pyramid: TilePyramid | None = None
+    embedding: np.ndarray | None = None  # memory-mapped SAM image embedding
+
+    @property
+    def nbytes(self) -> int:
+        total = 0
+        for img in (self.image, self.label):
+            if img is not None:
+                total += img.byteCount()
+        if self.sam_index is not None:
+            total += self.sam_index.nbytes
+        if self.pyramid is not None:
+            total += self.pyramid.nbytes
+        if self.embedding is not None:
+            total += self.embedding.nbytes
+        return total
+
+
+@dataclass
+class Preview:
+    # low resolution stand-in shown while full sample is decoded
+    stem: str
+    image: QImage
+    label: QImage | None
+    width: int  # full resolution size
+    height: int
+
+
+def decode_sample(
+    stem: str,
+    image_path: Path,
+    label_path: Path,
+    sam_path: Path,
+    label: QImage | None = None,
+    pyramid: TilePyramid | None = None,
+    embedding_path: Path | None = None,
+) -> Sample:
+    # QImage (unlike QPixmap) is safe to create outside of GUI thread
+    image = QImage(str(image_path)) if pyramid is None else None
+    sample = Sample(stem, image, label, pyramid=pyramid)
+    if label is None and label_path.exists():
+        sample.label = QImage(str(label_path))
+    npz_path = sam_path.with_suffix(".npz")
+    if npz_path.exists():
+        # lossless ids beyond 255 segments with precomputed index
+        sample.sam_index = SegmentIndex.load(npz_path)
+    elif sam_path.exists():
+        sample.sam_index = SegmentIndex(ids_from_image(QImage(str(sam_path))))
+    if embedding_path is not None and embedding_path.exists():
+        # pages are read on first prompt and then stay in OS page cache
+        sample.embedding = np.load(embedding_path, mmap_mode="r")
+    return sample
+
+
+def decode_packed_sample(
+    stem: str,
+    pack: PackedDataset,
+    label_path: Path,
+    label: QImage | None = None,
+) -> Sample:
+    # image and SAM come from memory-mapped pack, labels stay plain files
+    name = f"{stem}.png"
+    image = QImage.fromData(bytes(pack.read(f"images/{name}")))
+    sample = Sample(stem, image, label)
+    if label is None and label_path.exists():
+        sample.label = QImage(str(label_path))
+    if pack.exists(f"sam/{stem}.npz"):
+        sample.sam_index = SegmentIndex.load(io.BytesIO(pack.read(f"sam/{stem}.npz")))
+    elif pack.exists(f"sam/{name}"):
+        sam = QImage.fromData(bytes(pack.read(f"sam/{name}")))
+        sample.sam_index = SegmentIndex(ids_from_image(sam))
+    if pack.exists(f"embeddings/{stem}.npy"):
+        sample.embedding = pack.load_npy(f"embeddings/{stem}.npy")
+    return sample
+
+
+class SampleLoader:
+    def __init__(
+        self,
+        workdir: Path,
+        stems: list[str],
+        budget_mb: int,
+        prefetch: int,
+        workers: int,
+        label_writer: LabelWriter | None = None,
+        tile_min_megapixels: int = 0,
+        tile_size: int = 512,
+        tile_cache: int = 96,
+        pack: PackedDataset | None = None,
+        preview_size: int = 0,
+    ):
+        self._image_dir = workdir / "images"
+        self._label_dir = workdir / "labels"
+        self._sam_dir = workdir / "sam"
+        self._tile_dir = workdir / ".tiles"
+        self._embedding_dir = workdir / "embeddings"
+        self._preview_dir = workdir / ".previews"
+        self._preview_size = preview_size  # 0 disables previews
+        self._pack = pack
+        self._stems = stems
+        self._budget = budget_mb * 1024 * 1024
+        self._prefetch = prefetch
+        self._label_writer = label_writer
+        if label_writer is not None and preview_size > 0:
+            label_writer.on_written = self._on_label_written
+        self._tile_min_pixels = tile_min_megapixels * 1_000_000  # 0 disables tiling
+        self._tile_size = tile_size
+        self._tile_cache = tile_cache
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="sample_loader"
+        )
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[str, Sample] = OrderedDict()
+        self._pending: dict[str, Future] = {}
+        self._versions: dict[str, int] = {}  # bumped when cached data goes stale
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "cached": len(self._cache),
+                "bytes": self._bytes,
+                "budget": self._budget,
+            }
+
+    def _paths(self, stem: str) -> tuple[Path, Path, Path]:
+        name = f"{stem}.png"
+        return self._image_dir / name, self._label_dir / name, self._sam_dir / name
+
+    def _source_mtimes(self, stem: str) -> tuple[int, int]:
+        # image and label mtimes that previews are checked against, 0 if missing
+        image_path, label_path, _ = self._paths(stem)
+        source = image_path if self._pack is None else self._pack.index_path
+        try:
+            label_mtime = label_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            label_mtime = 0
+        return source.stat().st_mtime_ns, label_mtime
+
+    def _decode(self, stem: str) -> Sample:
+        image_path, label_path, sam_path = self._paths(stem)
+        label = None
+        if self._label_writer is not None:
+            # label file on disk is outdated until queued write lands
+            label = self._label_writer.pending(label_path)
+        # taken before decoding, so preview of replaced file is never marked fresh
+        mtimes = self._source_mtimes(stem) if self._preview_size > 0 else None
+        if label is not None and mtimes is not None:
+            mtimes = (mtimes[0], 0)  # pending label has no file yet
+        if self._pack is not None:
+            # tile pyramids are built from image files, so they are not used here
+            sample = decode_packed_sample(stem, self._pack, label_path, label)
+            self._submit_preview(sample, mtimes)
+            return sample
+        pyramid = None
+        if self._tile_min_pixels > 0:
+            size = QImageReader(str(image_path)).size()  # reads header only
+            if size.width() * size.height() >= self._tile_min_pixels:
+                pyramid = TilePyramid.open(
+                    image_path, self._tile_dir / stem, self._tile_size, self._tile_cache
+                )
+        embedding_path = self._embedding_dir / f"{stem}.npy"
+        sample = decode_sample(
+            stem, image_path, label_path, sam_path, label, pyramid, embedding_path
+        )
+        self._submit_preview(sample, mtimes)
+        return sample
+
+    def _submit_preview(self, sample: Sample, mtimes: tuple[int, int] | None):
+        # tiled images are fast to show without previews, small ones too
+        if mtimes is None or sample.image is None:
+            return
+        if max(sample.image.width(), sample.image.height()) <= self._preview_size:
+            return
+        try:
+            self._pool.submit(self._write_previews, sample, *mtimes)
+        except RuntimeError:
+            pass  # loader is shutting down
+
+    @staticmethod
+    def _preview_source(path: Path) -> str:
+        # reads PNG header only, empty string if file is missing
+        return QImageReader(str(path)).text("samat_source")
+
+    @staticmethod
+    def _save_preview(path: Path, image: QImage, mtime: int):
+        image.setText("samat_source", str(mtime))
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        # JPEG keeps image previews small, labels need exact colors of PNG
+        if image.save(str(tmp_path), "JPEG" if path.suffix == ".jpg" else "PNG", 85):
+            os.replace(tmp_path, path)
+
+    def _preview_scaled(self, image: QImage) -> QSize:
+        return image.size().scaled(
+            self._preview_size, self._preview_size, Qt.AspectRatioMode.KeepAspectRatio
+        )
+
+    def _write_previews(self, sample: Sample, image_mtime: int, label_mtime: int):
+        # written once per image and once per saved label version
+        self._preview_dir.mkdir(exist_ok=True)
+        size = self._preview_scaled(sample.image)
+        image_path = self._preview_dir / f"{sample.stem}.jpg"
+        if self._preview_source(image_path) != str(image_mtime):
+            image = sample.image.scaled(
+                size,
+                Qt.AspectRatioMode.IgnoreAspectRatio,
+                Qt.TransformationMode.SmoothTransformation,
+            )
+            image.setText(
+                "samat_size", f"{sample.image.width()}x{sample.image.height()}"
+            )
+            self._save_preview(image_path, image, image_mtime)
+        if label_mtime and sample.label is not None:
+            self._write_label_preview(sample.stem, sample.label, label_mtime)
+
+    def _write_label_preview(self, stem: str, label: QImage, label_mtime: int):
+        path = self._preview_dir / f"{stem}.label.png"
+        if self._preview_source(path) != str(label_mtime):
+            # nearest neighbour keeps label colors exact
+            label = label.scaled(
+                self._preview_scaled(label), Qt.AspectRatioMode.IgnoreAspectRatio
+            )
+            self._save_preview(path, label, label_mtime)
+
+    def _on_label_written(self, label_path: Path, label: QImage, mtime: int):
+        # label saved in GUI gets fresh preview right away, not on next decode
+        if not (self._preview_dir / f"{label_path.stem}.jpg").exists():
+            return  # tiled image or no preview written yet
+        try:
+            self._pool.submit(self._write_label_preview, label_path.stem, label, mtime)
+        except RuntimeError:
+            pass  # loader is shutting down
+
+    def preview(self, idx: int) -> Preview | None:
+        # None when image preview is missing or older than image
+        if self._preview_size == 0:
+            return None
+        stem = self._stems[idx]
+        image_mtime, label_mtime = self._source_mtimes(stem)
+        reader = QImageReader(str(self._preview_dir / f"{stem}.jpg"))
+        if reader.text("samat_source") != str(image_mtime):
+            return None
+        width, height = (int(v) for v in reader.text("samat_size").split("x"))
+        image = reader.read()
+        label = None
+        if self._label_writer is not None:
+            label = self._label_writer.pending(self._label_dir / f"{stem}.png")
+        if label is not None:
+            label = label.scaled(image.size(), Qt.AspectRatioMode.IgnoreAspectRatio)
+        elif label_mtime:
+            reader = QImageReader(str(self._preview_dir / f"{stem}.label.png"))
+            # label saved after preview was written is left out until rewritten
+            if reader.text("samat_source") == str(label_mtime):
+                label = reader.read()
+        return Preview(stem, image, label, width, height)
+
+    def _put(self, sample: Sample):
+        # caller must hold the lock
+        old = self._cache.pop(sample.stem, None)
+        if old is not None:
+            self._bytes -= old.nbytes
+        self._cache[sample.stem] = sample
+        self._bytes += sample.nbytes
+        while self._bytes > self._budget and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def _on_done(self, stem: str, version: int, future: Future):
+        with self._lock:
+            if self._pending.get(stem) is future:
+                del self._pending[stem]
+            if future.cancelled() or future.exception() is not None:
+                return
+            if self._versions.get(stem, 0) == version:
+                self._put(future.result())
+
+    def _submit(self, stem: str) -> Future:
+        # caller must hold the lock
+        future = self._pending.get(stem)
+        if future is None:
+            version = self._versions.get(stem, 0)
+            future = self._pool.submit(self._decode, stem)
+            self._pending[stem] = future
+            future.add_done_callback(lambda f: self._on_done(stem, version, f))
+        return future
+
+    def get(self, idx: int) -> Sample:
+        stem = self._stems[idx]
+        with self._lock:
+            sample = self._cache.get(stem)
+            if sample is not None:
+                self._cache.move_to_end(stem)
+                self.hits += 1
+            else:
+                self.misses += 1
+                future = self._pending.get(stem)
+        if sample is None:
+            # decode right here unless a prefetch is already in flight
+            sample = future.result() if future is not None else self._decode(stem)
+            with self._lock:
+                self._put(sample)
+        self.prefetch_around(idx)
+        return sample
+
+    def fetch(self, idx: int, on_ready: Callable[[], None]) -> Sample | None:
+        # cached sample without waiting, otherwise None and on_ready is called
+        # from worker thread once sample is decoded and cached
+        stem = self._stems[idx]
+        with self._lock:
+            sample = self._cache.get(stem)
+            if sample is not None:
+                self._cache.move_to_end(stem)
+                self.hits += 1
+            else:
+                self.misses += 1
+                future = self._submit(stem)
+        if sample is None:
+            # runs after cache insert, callbacks are called in order of adding
+            future.add_done_callback(lambda _: on_ready())
+        self.prefetch_around(idx)
+        return sample
+
+    def prefetch_around(self, idx: int):
+        with self._lock:
+            for step in range(1, self._prefetch + 1):
+                for i in (idx + step, idx - step):
+                    if 0 <= i < len(self._stems) and self._stems[i] not in self._cache:
+                        self._submit(self._stems[i])
+
+    def update_label(self, stem: str, label: QImage | None):
+        # keeps cache coherent with labels edited in GUI
+        with self._lock:
+            self._versions[stem] = self._versions.get(stem, 0) + 1
+            self._pending.pop(stem, None)  # in-flight decode holds stale label
+            sample = self._cache.get(stem)
+            if sample is not None:
+                self._bytes -= sample.nbytes
+                sample.label = label
+                self._bytes += sample.nbytes
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
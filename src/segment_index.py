@@ -0,0 +1,122 @@
+from pathlib import Path
+from typing import BinaryIO
+
+from PyQt5.QtGui import QColor, QImage
+import numpy as np
+
+# distinct hues spread by golden ratio, id 0 is transparent background
+SEGMENT_COLORS = [0] + [
+    QColor.fromHsvF((i * 0.618034) % 1.0, 0.8, 1.0).rgba() for i in range(1, 256)
+]
+
+
+def ids_from_image(image: QImage) -> np.ndarray:
+    # gray of grayscale mask is segment id, rows keep 32-bit aligned padding
+    image = image.convertToFormat(QImage.Format.Format_Grayscale8)
+    buffer = image.constBits()
+    buffer.setsize(image.byteCount())
+    ids = np.frombuffer(buffer, dtype=np.uint8).reshape((image.height(), -1))
+    return ids.copy()[:, : image.width()]
+
+
+def display_ids(ids: np.ndarray) -> np.ndarray:
+    # uint8 ids with 32-bit aligned rows, which Indexed8 QImage can wrap,
+    # ids that already are such are returned as is, so nothing is copied
+    h, w = ids.shape
+    aligned = ids.strides[0] % 4 == 0 and ids.ctypes.data % 4 == 0
+    if ids.dtype == np.uint8 and ids.strides[1] == 1 and aligned:
+        return ids
+    buffer = np.empty((h, (w + 3) // 4 * 4), dtype=np.uint8)
+    # wide ids keep low byte, so colors repeat every 256 segments
+    buffer[:, :w] = ids
+    return buffer[:, :w]
+
+
+class SegmentIndex:
+    # CSR-like index: flat pixel offsets grouped by segment id,
+    # kept as uint32 (4 B/px), images are far below 2**32 pixels
+    def __init__(
+        self,
+        ids: np.ndarray,
+        order: np.ndarray | None = None,
+        offsets: np.ndarray | None = None,
+        bboxes: np.ndarray | None = None,
+    ):
+        assert ids.ndim == 2, f"Segment ids must be 2D array, but {ids.ndim}D was given"
+        self._shape = ids.shape
+        self._ids = ids
+        self._bboxes = bboxes
+        # fmt: off
+        assert ids.size < 2**32, f"Segment ids must have less than 2**32 pixels, but {ids.size} were given"  # noqa: E501
+        # fmt: on
+        if order is not None and offsets is not None:
+            self._order = order.astype(np.uint32, copy=False)
+            self._offsets = offsets.astype(np.uint32, copy=False)
+            return
+        flat = ids.ravel()
+        # stable sort of small unsigned ints is a radix sort in numpy
+        self._order = np.argsort(flat, kind="stable").astype(np.uint32)
+        counts = np.bincount(flat, minlength=int(flat.max(initial=0)) + 1)
+        self._offsets = np.zeros(len(counts) + 1, dtype=np.uint32)
+        np.cumsum(counts, out=self._offsets[1:])
+
+    @staticmethod
+    def load(path: Path | BinaryIO) -> "SegmentIndex":
+        # .npz written by scripts/sam_format.py, index is stored so nothing is sorted
+        with np.load(path) as data:
+            ids = data["ids"]
+            if ids.dtype == np.uint8:
+                ids = display_ids(ids)  # overlay then shares this buffer
+            # negative deltas wrap around, sums stay exact modulo 2**32
+            order = np.cumsum(data["order_delta"], dtype=np.uint32)
+            offsets = data["offsets"]
+            bboxes = data["bboxes"]
+        return SegmentIndex(ids, order, offsets, bboxes)
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self._shape
+
+    @property
+    def nbytes(self) -> int:
+        total = self._ids.nbytes + self._order.nbytes + self._offsets.nbytes
+        if self._bboxes is not None:
+            total += self._bboxes.nbytes
+        return total
+
+    @property
+    def num_segments(self) -> int:
+        return len(self._offsets) - 1
+
+    @property
+    def bboxes(self) -> np.ndarray:
+        # (x0, y0, x1, y1) per segment, inclusive, -1 for empty segments
+        if self._bboxes is None:
+            counts = np.diff(self._offsets)
+            nonempty = counts > 0
+            starts = self._offsets[:-1][nonempty]
+            ys, xs = np.divmod(self._order, self._shape[1])
+            self._bboxes = np.full((len(counts), 4), -1, dtype=np.int32)
+            self._bboxes[nonempty, 0] = np.minimum.reduceat(xs, starts)
+            self._bboxes[nonempty, 1] = np.minimum.reduceat(ys, starts)
+            self._bboxes[nonempty, 2] = np.maximum.reduceat(xs, starts)
+            self._bboxes[nonempty, 3] = np.maximum.reduceat(ys, starts)
+        return self._bboxes
+
+    def segment_at(self, x: int, y: int) -> int:
+        h, w = self._shape
+        if not (0 <= x < w and 0 <= y < h):
+            return 0
+        return int(self._ids[y, x])
+
+    def pixels(self, seg_id: int) -> np.ndarray:
+        # returns (N, 2) array of (x, y) pairs
+        if not 0 <= seg_id < self.num_segments:
+            return np.empty((0, 2), dtype=np.int64)
+        flat = self._order[self._offsets[seg_id] : self._offsets[seg_id + 1]]
+        ys, xs = np.divmod(flat, self._shape[1])
+        return np.column_stack((xs, ys))
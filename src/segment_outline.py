@@ -0,0 +1,22 @@
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QPainterPath, QPen
+from PyQt5.QtWidgets import QGraphicsPathItem
+
+
+class SegmentOutline(QGraphicsPathItem):
+    # outline of SAM segment under cursor, shows what click would fill
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        pen = QPen(Qt.GlobalColor.white)
+        pen.setWidth(2)
+        pen.setCosmetic(True)  # same width at any zoom
+        self.setPen(pen)
+        self.setAcceptedMouseButtons(Qt.MouseButton.NoButton)
+        self.segment = 0
+
+    def set_segment(self, seg_id: int, path: QPainterPath):
+        self.segment = seg_id
+        self.setPath(path)  # repaints old and new bounding rects only
+
+    def clear(self):
+        self.set_segment(0, QPainterPath())
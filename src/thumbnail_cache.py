@@ -0,0 +1,112 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+import os
+import threading
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImage, QImageReader
+
+from .packed_dataset import PackedDataset
+
+
+class ThumbnailCache:
+    # JPEG thumbnail per sample in <data>/.thumbnails, built on first request
+    # by worker threads, decoded thumbnails of recent requests stay in memory
+    def __init__(
+        self,
+        workdir: Path,
+        stems: list[str],
+        size: int = 96,
+        workers: int = 2,
+        max_items: int = 1024,
+        pack: PackedDataset | None = None,
+    ):
+        self._image_dir = workdir / "images"
+        self._preview_dir = workdir / ".previews"
+        self._dir = workdir / ".thumbnails"
+        self._dir.mkdir(exist_ok=True)
+        self._stems = stems
+        self._size = size
+        self._max_items = max_items
+        self._pack = pack
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="thumbnails"
+        )
+        self._lock = threading.Lock()
+        self._images: OrderedDict[int, QImage] = OrderedDict()
+        self._pending: set[int] = set()
+        self._wanted = range(len(stems))
+
+    def set_wanted(self, first: int, last: int):
+        # queued requests outside of this range are dropped when their turn comes
+        with self._lock:
+            self._wanted = range(first, last + 1)
+
+    def get(self, idx: int, on_ready: Callable[[int], None]) -> QImage | None:
+        # None while thumbnail is built, on_ready(idx) is then called from worker
+        with self._lock:
+            image = self._images.get(idx)
+            if image is not None:
+                self._images.move_to_end(idx)
+                return image
+            if idx in self._pending:
+                return None
+            self._pending.add(idx)
+        try:
+            self._pool.submit(self._load, idx, on_ready)
+        except RuntimeError:
+            pass  # cache is shutting down
+        return None
+
+    def _load(self, idx: int, on_ready: Callable[[int], None]):
+        try:
+            with self._lock:
+                if idx not in self._wanted:
+                    return  # scrolled away before job started
+            image = self._read(self._stems[idx])
+        finally:
+            with self._lock:
+                self._pending.discard(idx)
+        if image.isNull():
+            return
+        with self._lock:
+            self._images[idx] = image
+            while len(self._images) > self._max_items:
+                self._images.popitem(last=False)
+        on_ready(idx)
+
+    def _read(self, stem: str) -> QImage:
+        path = self._dir / f"{stem}.jpg"
+        name = f"{stem}.png"
+        source = self._image_dir / name if self._pack is None else self._pack.index_path
+        source_mtime = source.stat().st_mtime_ns
+        try:
+            if path.stat().st_mtime_ns >= source_mtime:
+                return QImage(str(path))
+        except FileNotFoundError:
+            pass
+        # fresh preview is much cheaper to decode than full image
+        reader = QImageReader(str(self._preview_dir / f"{stem}.jpg"))
+        if reader.text("samat_source") == str(source_mtime):
+            image = reader.read()
+        elif self._pack is not None:
+            image = QImage.fromData(bytes(self._pack.read(f"images/{name}")))
+        else:
+            image = QImage(str(source))
+        if image.isNull():
+            return image
+        thumbnail = image.scaled(
+            self._size,
+            self._size,
+            Qt.AspectRatioMode.KeepAspectRatio,
+            Qt.TransformationMode.SmoothTransformation,
+        )
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        if thumbnail.save(str(tmp_path), "JPEG", 85):
+            os.replace(tmp_path, path)
+        return thumbnail
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
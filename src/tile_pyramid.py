@@ -0,0 +1,140 @@
+from collections import OrderedDict
+from pathlib import Path
+import json
+import math
+import threading
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImage
+import numpy as np
+
+
+class TilePyramid:
+    # mip pyramid of fixed size tiles cached on disk, level 0 is full resolution
+    def __init__(self, cache_dir: Path, meta: dict, max_tiles: int):
+        self._cache_dir = cache_dir
+        self.width = meta["width"]
+        self.height = meta["height"]
+        self.tile_size = meta["tile_size"]
+        self.levels = meta["levels"]
+        self._max_tiles = max_tiles
+        self._lock = threading.Lock()
+        self._tiles: OrderedDict[tuple[int, int, int], QImage] = OrderedDict()
+
+    @staticmethod
+    def open(
+        image_path: Path, cache_dir: Path, tile_size: int, max_tiles: int
+    ) -> "TilePyramid":
+        meta_path = cache_dir / "meta.json"
+        stat = image_path.stat()
+        source = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        meta = None
+        if meta_path.exists():
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            if meta["source"] != source or meta["tile_size"] != tile_size:
+                meta = None
+        if meta is None:
+            meta = TilePyramid._build(image_path, cache_dir, tile_size)
+            meta["source"] = source
+            # meta is written last, so interrupted build is redone on next open
+            with open(meta_path, "w") as f:
+                json.dump(meta, f)
+        return TilePyramid(cache_dir, meta, max_tiles)
+
+    @staticmethod
+    def _build(image_path: Path, cache_dir: Path, tile_size: int) -> dict:
+        # PNG has no random access, so source is decoded in full only this once
+        image = QImage(str(image_path))
+        assert not image.isNull(), f"Failed to decode {image_path}"
+        width, height = image.width(), image.height()
+        levels = 1 + max(0, math.ceil(math.log2(max(width, height) / tile_size)))
+        for level in range(levels):
+            level_dir = cache_dir / str(level)
+            level_dir.mkdir(parents=True, exist_ok=True)
+            for ty in range(math.ceil(image.height() / tile_size)):
+                for tx in range(math.ceil(image.width() / tile_size)):
+                    x, y = tx * tile_size, ty * tile_size
+                    tile = image.copy(
+                        x,
+                        y,
+                        min(tile_size, image.width() - x),
+                        min(tile_size, image.height() - y),
+                    )
+                    # high quality means low zlib level: tiles are read far more often
+                    tile.save(str(level_dir / f"{tx}_{ty}.png"), "PNG", 90)
+            image = image.scaled(
+                math.ceil(image.width() / 2),
+                math.ceil(image.height() / 2),
+                Qt.AspectRatioMode.IgnoreAspectRatio,
+                Qt.TransformationMode.SmoothTransformation,
+            )
+        return {
+            "width": width,
+            "height": height,
+            "tile_size": tile_size,
+            "levels": levels,
+        }
+
+    @property
+    def nbytes(self) -> int:
+        # upper bound of decoded tiles kept in memory
+        return self._max_tiles * self.tile_size * self.tile_size * 4
+
+    def level_for(self, lod: float) -> int:
+        # coarsest level that still has at least one texel per screen pixel
+        if lod <= 0:
+            return self.levels - 1
+        level = int(math.floor(math.log2(1 / lod))) if lod < 1 else 0
+        return min(max(level, 0), self.levels - 1)
+
+    def region(self, x0: int, y0: int, x1: int, y1: int) -> np.ndarray:
+        # (y1 - y0, x1 - x0) uint32 RGB32 pixels of level 0 read from tile files,
+        # bypasses cache to keep visible tiles
+        s = self.tile_size
+        pixels = np.empty((y1 - y0, x1 - x0), dtype=np.uint32)
+        for ty in range(y0 // s, math.ceil(y1 / s)):
+            for tx in range(x0 // s, math.ceil(x1 / s)):
+                tile = QImage(str(self._cache_dir / "0" / f"{tx}_{ty}.png"))
+                tile = tile.convertToFormat(QImage.Format.Format_RGB32)
+                buffer = tile.constBits()
+                buffer.setsize(tile.byteCount())
+                src = np.frombuffer(buffer, dtype=np.uint32)
+                src = src.reshape((tile.height(), tile.width()))
+                tx0, ty0 = tx * s, ty * s
+                ax, ay = max(x0, tx0), max(y0, ty0)
+                bx, by = min(x1, tx0 + tile.width()), min(y1, ty0 + tile.height())
+                pixels[ay - y0 : by - y0, ax - x0 : bx - x0] = src[
+                    ay - ty0 : by - ty0, ax - tx0 : bx - tx0
+                ]
+        return pixels
+
+    def tile(self, level: int, tx: int, ty: int) -> QImage:
+        key = (level, tx, ty)
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                return tile
+        tile = QImage(str(self._cache_dir / str(level) / f"{tx}_{ty}.png"))
+        with self._lock:
+            self._tiles[key] = tile
+            while len(self._tiles) > self._max_tiles:
+                self._tiles.popitem(last=False)
+        return tile
+
+
+class TilePixels:
+    # (H, W) uint32 RGB32 pixels of pyramid level 0 for color wand, indexing
+    # reads only tiles under requested window instead of whole image
+    def __init__(self, pyramid: TilePyramid):
+        self._pyramid = pyramid
+        self.shape = (pyramid.height, pyramid.width)
+
+    def __getitem__(self, key: tuple[int | slice, int | slice]):
+        ys, xs = key
+        if isinstance(ys, int) and isinstance(xs, int):
+            return self._pyramid.region(xs, ys, xs + 1, ys + 1)[0, 0]
+        y0, y1, _ = ys.indices(self.shape[0])
+        x0, x1, _ = xs.indices(self.shape[1])
+        return self._pyramid.region(x0, y0, x1, y1)
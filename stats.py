@@ -0,0 +1,31 @@
+"""
+Headless dataset QA: per-class pixel counts, empty labels,
+colors missing from classes.json and SAM coverage for every label.
+Writes stats.json and stats.csv, e.g. python stats.py --out report
+"""
+
+import argparse
+import os
+import time
+import tomllib
+from pathlib import Path
+
+from src.dataset_stats import collect_stats, summarize, write_report
+
+if __name__ == "__main__":
+    with open("config.toml", "rb") as f:
+        config = tomllib.load(f)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data", default=config["paths"]["data"])
+    parser.add_argument("--out", default="report")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    t = time.perf_counter()
+    results = collect_stats(Path(args.data), args.workers)
+    write_report(results, Path(args.out))
+    summary = summarize(results)
+    print(f"Processed {summary['labels']} labels in {time.perf_counter() - t:.1f}s")
+    for key in ("unreadable", "empty", "unknown_colors", "size_mismatch"):
+        print(f"{key}: {len(summary[key])}")
+    print(f"Report saved to {args.out}/")